@@ -0,0 +1,113 @@
+# This module folds the case linelist into the compact counts the dashboard displays.
+
+import numpy as np
+import pandas as pd
+
+import countries
+
+# Linelist column counted for each aggregate. Every column is counted in the same pass
+# over a chunk, so adding a breakdown here (e.g. an age band) costs no extra scans.
+AGGREGATE_COLUMNS = {
+    'country': 'Country Key',
+    'gender': 'Gender',
+    'hospitalised': 'Hospitalised (Y/N/NA)',
+    'status': 'Status',
+    'age': 'Age',
+    'date': 'Date_confirmation',
+}
+
+
+class CaseAggregates:
+    '''Running per-value counts over the linelist, built one chunk at a time.
+
+    Each column is counted from its categorical codes with a single bincount, and
+    the sorted results are kept until more rows are folded in. Memory use depends
+    only on the number of distinct values (countries, dates, ...), not on the
+    number of rows folded in.
+    '''
+
+    def __init__(self):
+        self.rows = 0
+        self._counts = {key: pd.Series(dtype = 'int64') for key in AGGREGATE_COLUMNS}
+        self._results = dict()
+
+    def __getstate__(self):
+        # Keys past the country table are numbered per process (see countries.py), so
+        # they travel with their names and are keyed again by the receiving process
+        return {'rows': self.rows, '_counts': self._counts,
+            '_extra_names': countries.extra_names(self._counts['country'].index.values)}
+
+    def __setstate__(self, state):
+        self.rows, self._counts = state['rows'], state['_counts']
+        self._results = dict()
+        if state['_extra_names']:
+            country = self._counts['country']
+            self._counts['country'] = country.set_axis(countries.rekey(country.index.values, state['_extra_names']))
+
+    def add(self, chunk: pd.DataFrame):
+        '''Folds a chunk of linelist rows into the running counts'''
+
+        self.rows += len(chunk)
+        self._results.clear()
+        for key, column in AGGREGATE_COLUMNS.items():
+            if column not in chunk.columns:
+                continue
+            counts = category_counts(chunk[column])
+            self._counts[key] = self._counts[key].add(counts, fill_value = 0).astype('int64')
+
+    def breakdown(self, key: str) -> pd.Series:
+        '''Cases per value of an aggregate column, largest first'''
+
+        if key not in self._results:
+            counts = self._counts[key].sort_values(ascending = False, kind = 'stable')
+            counts.name = AGGREGATE_COLUMNS[key]
+            self._results[key] = counts
+        return self._results[key]
+
+    @property
+    def country(self) -> pd.Series:
+        '''Cases per country, indexed by Country Key (see countries.py), largest first'''
+        return self.breakdown('country')
+
+    @property
+    def gender(self) -> pd.Series:
+        '''Cases per reported gender'''
+        return self.breakdown('gender')
+
+    @property
+    def hospitalised(self) -> pd.Series:
+        '''Cases per hospitalisation status (Y/N/NA)'''
+        return self.breakdown('hospitalised')
+
+    @property
+    def status(self) -> pd.Series:
+        '''Cases per case status (confirmed/suspected)'''
+        return self.breakdown('status')
+
+    @property
+    def age(self) -> pd.Series:
+        '''Cases per reported age band'''
+        return self.breakdown('age')
+
+    @property
+    def date(self) -> pd.Series:
+        '''Cases per confirmation date, in date order'''
+
+        if 'date' not in self._results:
+            counts = self._counts['date']
+            counts = counts.set_axis(pd.to_datetime(counts.index, errors = 'coerce'))
+            self._results['date'] = counts[counts.index.notna()].groupby(level = 0).sum()
+        return self._results['date']
+
+
+def category_counts(column: pd.Series) -> pd.Series:
+    '''Returns the count of each value present in a column, counted from its category codes'''
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, values = column.cat.codes.values, column.cat.categories.astype(object)
+    else:
+        codes, values = pd.factorize(column)
+
+    counts = np.bincount(codes[codes >= 0], minlength = len(values))
+    present = counts > 0
+    return pd.Series(counts[present], index = pd.Index(values[present]))
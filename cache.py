@@ -0,0 +1,161 @@
+# This module provides the process-wide cache shared by every dashboard session.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+# Cached datasets are served for this many seconds before being reloaded
+DEFAULT_TTL = int(os.environ.get('MPX_CACHE_TTL', 6 * 60 * 60))
+
+# Maximum number of cached results kept in memory at once
+DEFAULT_MAX_ENTRIES = int(os.environ.get('MPX_CACHE_MAX_ENTRIES', 16))
+
+
+class DataCache:
+    '''Thread-safe in-memory cache with a TTL, a size bound and hit/miss counters.
+
+    Values are shared between all sessions of the Streamlit process, so callers
+    must treat them as read-only.
+    '''
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = dict()
+        self._generation = 0
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0,
+            'load_seconds': 0.0, 'last_load_seconds': dict()}
+
+    def get_or_load(self, key, loader):
+        '''Returns the cached value for key, calling loader() on a miss or after expiry'''
+
+        staged = getattr(self._local, 'staged', None)
+        if staged is not None:
+            return self._get_or_load_staged(staged, key, loader)
+
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        # Only one thread loads a given key; the others wait and reuse its result
+        with self._key_lock(key):
+            value = self._lookup(key)
+            if value is not _MISSING:
+                return value
+
+            generation = self._generation
+            start = time.perf_counter()
+            value = loader()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._stats['misses'] += 1
+                self._stats['load_seconds'] += elapsed
+                self._stats['last_load_seconds'][key[0]] = elapsed
+
+                # A clear() while loading means this value may already be stale
+                if generation != self._generation:
+                    return value
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last = False)
+                    self._stats['evictions'] += 1
+            return value
+
+    def cached(self, func):
+        '''Decorator caching func's return value per set of arguments'''
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return self.get_or_load(key, lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    @contextmanager
+    def staging(self):
+        '''Loads into a private set of entries that replaces the cached ones on exit.
+
+        Only the calling thread sees the staged entries; every other thread keeps
+        reading the current ones until all staged values are swapped in at once. An
+        exception discards the staged entries.
+        '''
+
+        self._local.staged = OrderedDict()
+        try:
+            yield
+            staged = self._local.staged
+            with self._lock:
+                expires = time.monotonic() + self.ttl
+                self._entries = OrderedDict((key, (expires, value)) for key, value in staged.items())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last = False)
+                    self._stats['evictions'] += 1
+                self._generation += 1
+                self._stats['invalidations'] += 1
+        finally:
+            del self._local.staged
+
+    @property
+    def generation(self) -> int:
+        '''Number of times the cached entries were cleared or swapped'''
+        return self._generation
+
+    def clear(self):
+        '''Drops every cached value so the next access reloads it'''
+
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> dict:
+        '''Returns a snapshot of the cache counters'''
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats['last_load_seconds'] = dict(self._stats['last_load_seconds'])
+            stats['entries'] = len(self._entries)
+            return stats
+
+    # ----------------- HELPER FUNCTIONS ---------------- #
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def _get_or_load_staged(self, staged, key, loader):
+        if key in staged:
+            return staged[key]
+
+        start = time.perf_counter()
+        value = loader()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['load_seconds'] += elapsed
+            self._stats['last_load_seconds'][key[0]] = elapsed
+        staged[key] = value
+        return value
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+
+_MISSING = object()
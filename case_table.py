@@ -0,0 +1,129 @@
+# This module serves the cumulative case table one page at a time.
+#
+# The table is built once per data version. Sorting and search run on the server
+# against precomputed orderings, and only the current page is sent to the grid.
+# Selected rows are tracked by country name, so selections survive paging and
+# sorting without the grid returning whole rows.
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Rows sent to the grid per page
+PAGE_SIZE = 20
+
+# Data versions whose tables are kept in memory
+MAX_TABLES = 2
+
+# Searches whose sorted row positions each table keeps
+MAX_QUERIES = 64
+
+_lock = threading.Lock()
+_tables = OrderedDict()
+
+
+class CaseTable:
+    '''Read-only cumulative case table with cached sort orders and searches'''
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+        # Rows are keyed by the country column (the table's first)
+        self.key = self.frame.columns[0]
+        self._names = self.frame[self.key].str.lower().values
+        self._positions = pd.Series(np.arange(len(self.frame)), index = self.frame[self.key])
+        self._positions = self._positions[~self._positions.index.duplicated()]
+
+        # Kept on the instance, so they are freed with the table when get() evicts it
+        self._orders = dict()
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def order(self, column: str, descending: bool) -> np.ndarray:
+        '''Returns row positions sorted by a column; unavailable values sort last'''
+
+        key = (column, descending)
+        with self._lock:
+            order = self._orders.get(key)
+        if order is None:
+            order = self._sort(column, descending)
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    def query(self, search: str, column: str, descending: bool) -> np.ndarray:
+        '''Returns the sorted row positions whose country name contains search'''
+
+        key = (search, column, descending)
+        with self._lock:
+            positions = self._queries.get(key)
+            if positions is not None:
+                self._queries.move_to_end(key)
+                return positions
+
+        positions = self._search(search, self.order(column, descending))
+        with self._lock:
+            self._queries[key] = positions
+            while len(self._queries) > MAX_QUERIES:
+                self._queries.popitem(last = False)
+        return positions
+
+    def page_count(self, positions: np.ndarray) -> int:
+        return max(1, math.ceil(len(positions) / PAGE_SIZE))
+
+    def page(self, positions: np.ndarray, number: int) -> pd.DataFrame:
+        '''Returns the rows of a 1-based page of the given row positions'''
+
+        start = (number - 1) * PAGE_SIZE
+        return self.frame.iloc[positions[start:start + PAGE_SIZE]]
+
+    def rows(self, keys: list[str]) -> pd.DataFrame:
+        '''Returns the rows of the given countries, in the given order'''
+
+        keys = [key for key in keys if key in self._positions.index]
+        return self.frame.iloc[self._positions[keys].values]
+
+    def _sort(self, column, descending):
+        values = pd.to_numeric(self.frame[column], errors = 'coerce').reset_index(drop = True)
+        if values.isna().all():
+            values = self.frame[column].astype(str).str.lower().reset_index(drop = True)
+        order = values.sort_values(ascending = not descending, na_position = 'last', kind = 'stable')
+        return order.index.values
+
+    def _search(self, search, order):
+        search = search.strip().lower()
+        if not search:
+            return order
+        matches = np.char.find(self._names.astype(str), search) >= 0
+        return order[matches[order]]
+
+
+def get(data_version: str, build) -> CaseTable:
+    '''Returns the table of a data version, calling build() to make it on first use'''
+
+    with _lock:
+        table = _tables.get(data_version)
+        if table is not None:
+            _tables.move_to_end(data_version)
+            return table
+
+    table = build()
+    with _lock:
+        _tables[data_version] = table
+        while len(_tables) > MAX_TABLES:
+            _tables.popitem(last = False)
+    return table
+
+
+def update_selection(selected: list[str], page_keys: list[str], chosen: list[str]) -> list[str]:
+    '''Returns the selected keys after the grid reported chosen for the current page.
+
+    Keys on other pages stay selected; the page's keys follow the grid.
+    '''
+
+    page_keys = set(page_keys)
+    kept = [key for key in selected if key not in page_keys or key in chosen]
+    return kept + [key for key in chosen if key not in kept]
@@ -1,15 +1,33 @@
 # Contains functions to create the various charts and graphs.
 
+import altair as alt
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib import ticker
-from st_aggrid import GridOptionsBuilder, AgGrid
+from matplotlib import dates
+
+import countries
+import metrics
+
+# Countries shown in the cumulative case chart until the user picks others
+DEFAULT_COUNTRIES = ['United States', 'Germany', 'Spain', 'United Kingdom']
+
+# Most rows embedded in the cumulative case chart, shared between the selected countries
+MAX_CHART_POINTS = 3000
+
+# Date ranges offered for the total cases graph, in days (None for the whole outbreak)
+CASE_GRAPH_RANGES = {'Whole Outbreak': None, 'Last 90 Days': 90, 'Last 30 Days': 30}
+
+# Share of its period each bar of the total cases graph covers
+BAR_FILL = 0.8
 
 # ------- Cumulative Case Table ------- #
-def cumulative_cases(df: pd.DataFrame, countries: list[str], cases: list[int]):
+def cumulative_cases(latest: pd.Series, country_counts: pd.Series):
     '''Returns components to build cumulative case table'''
 
-    merged = get_daily_increases(df, countries, cases)
+    from st_aggrid import GridOptionsBuilder, AgGrid
+
+    merged = get_daily_increases(latest, country_counts)
 
     gb = GridOptionsBuilder.from_dataframe(merged)
     gb.configure_side_bar()
@@ -35,12 +53,70 @@ def cumulative_cases(df: pd.DataFrame, countries: list[str], cases: list[int]):
     return (gb, grid_response)
 
 
-# ------- Total Global Cases Graph ------- #
-def global_case_graph(df: pd.DataFrame):
-    '''Returns tuple with matplotlib (figure, axis1, axis2)'''
+# ------- Cumulative Cases by Country Chart ------- #
+@metrics.timed
+def cumulative_case_chart(df: pd.DataFrame, max_points: int = None):
+    '''Returns layered Altair line chart of cumulative cases for the countries in df
+
+    The data is trimmed to the plotted columns, downsampled to at most max_points
+    rows and attached once to the whole layer, so every layer shares one dataset.
+    '''
+
+    max_points = max_points or MAX_CHART_POINTS
+    df = cumulative_chart_data(df, max_points)
+
+    nearest = alt.selection(type='single', nearest=True, on='mouseover',
+                            fields=['Date'], empty='none')
+
+    line_chart = alt.Chart().mark_line(interpolate = 'basis').encode(
+        x = alt.X('Date:T', axis = alt.Axis(title = 'Date', tickMinStep = 2)),
+        y = 'Cumulative Cases:Q',
+        color = 'Country:N'
+    )
+
+    selectors = alt.Chart().mark_point().encode(
+        x = alt.X('Date:T', axis = alt.Axis(title = 'Date', tickMinStep = 2)),
+        opacity=alt.value(0),
+    ).add_selection(
+        nearest
+    )
+
+    points = line_chart.mark_point().encode(
+        opacity=alt.condition(nearest, alt.value(1), alt.value(0))
+    )
+
+    text = line_chart.mark_text(align='left', dx=5, dy=-5).encode(
+        text=alt.condition(nearest, 'Cumulative Cases', alt.value(' '))
+    )
+
+    rules = alt.Chart().mark_rule(color='gray').encode(
+        x = alt.X('Date:T', axis = alt.Axis(title = 'Date', tickMinStep = 2))
+    ).transform_filter(
+        nearest
+    )
+
+    return alt.layer(
+        line_chart, selectors, points, rules, text, data = df
+    ).properties(
+        width=600, height=300
+    ).configure_axisX(labelAngle = 90).interactive()
 
-    # Removing early dates with almost no cases
-    df = df.iloc[60:]
+
+# ------- Total Global Cases Graph ------- #
+@metrics.timed
+def global_case_graph(rollups, days: int = None):
+    '''Returns tuple with matplotlib (figure, axis1, axis2)
+
+    Shows the last `days` days, or the whole outbreak since it took off. Longer
+    ranges are drawn at weekly or monthly resolution (see rollups.Rollups), so the
+    number of points drawn stays bounded as the history grows.
+    '''
+
+    if days is None:
+        start = rollups.active_start()
+    else:
+        start = rollups.end_date() - pd.Timedelta(days = days)
+    resolution, df = rollups.global_cases(start)
     
     # Axis 1: total cases
     fig, ax = plt.subplots()
@@ -48,16 +124,21 @@ def global_case_graph(df: pd.DataFrame):
     ax.set_xlabel('Date')
     ax.set_ylabel('Total Cases', color = 'purple')
     ax.tick_params(axis = 'y', labelcolor = 'purple')
+    ax.set_ylim(bottom = 0)
 
-    # Axis 2: daily cases
+    # Axis 2: new cases per period, each bar centred on the span it counts
     ax2 = ax.twinx()
-    ax2.bar(df['Date'], df['Cases'], label = 'Daily Increase', color = 'teal')
-    ax2.set_ylabel('Daily Increase', color = 'teal')
-    ax2.set(ylim=(0, 5000))
+    spans = df['End'] - df['Start']
+    ax2.bar(df['Start'] + spans / 2, df['Cases'], label = f'{resolution.title()} Increase', color = 'teal',
+        width = spans.dt.total_seconds() / 86400 * BAR_FILL)
+    ax2.set_ylabel(f'{resolution.title()} Increase', color = 'teal')
+    ax2.set(ylim=(0, max(df['Cases'].max(), 1) * 1.15))
     ax2.tick_params(axis = 'y', labelcolor = 'teal')
 
-    xticks = ticker.MaxNLocator(5)
+    # A low minticks lets multi-year ranges fall back to yearly ticks
+    xticks = dates.AutoDateLocator(minticks = 3, maxticks = 5)
     ax.xaxis.set_major_locator(xticks)
+    ax.xaxis.set_major_formatter(dates.ConciseDateFormatter(xticks))
 
 
     fig.tight_layout()
@@ -65,6 +146,7 @@ def global_case_graph(df: pd.DataFrame):
     return (fig, ax, ax2)
 
 # ------- Global Cases Breakdown Pie Chart ------- #
+@metrics.timed
 def global_pie_chart(countries: list[str], cases: list[int]):
     '''Returns tuple with matplotlib (figure, axis)'''
 
@@ -85,66 +167,132 @@ def global_pie_chart(countries: list[str], cases: list[int]):
 
 
 # ------- Gender Distribution Pie Chart ------- #
-def gender_chart(df: pd.DataFrame):
-    '''Returns tuple with matplotlib (figure, axis)'''
+@metrics.timed
+def gender_chart(gender_counts: pd.Series):
+    '''Returns tuple with matplotlib (figure, axis)
+
+    gender_counts holds cases per reported gender (see aggregates.CaseAggregates).
+    '''
 
-    gender_data = df[df['Gender'].isin(('male', 'female'))]['Gender']
-    males = len([person for person in gender_data.to_dict().values() if person == 'male'])
-    females = len([person for person in gender_data.to_dict().values() if person == 'female'])
-    gender_df = pd.DataFrame({'Gender': ['Male', 'Female'], 'Count': [males, females]})
+    counts = gender_counts.reindex(['male', 'female'], fill_value = 0)
 
     fig, ax = plt.subplots()
     fig.set_figheight(7)
-    gender_list = [gender_df['Count'].iloc[0], gender_df['Count'].iloc[1]]
     colors = ['teal', 'purple']
-    ax.pie(list(gender_list), labels = gender_df['Gender'], autopct='%1.1f%%',
+    ax.pie(counts.values, labels = ['Male', 'Female'], autopct='%1.1f%%',
                 shadow=False, startangle=90, colors = colors)
 
     return (fig, ax)
 
 
 # ------- Hospitalization Bar Chart ------- #
-def hospitalization_chart(df: pd.DataFrame):
-    '''Returns tuple with matplotlib (figure, axis)'''
+@metrics.timed
+def hospitalization_chart(hospitalised_counts: pd.Series):
+    '''Returns tuple with matplotlib (figure, axis)
 
+    hospitalised_counts holds cases per hospitalisation status (see aggregates.CaseAggregates).
+    '''
 
-    hospitalized_dict = df['Hospitalised (Y/N/NA)'].value_counts().to_dict()
-    hospitalized_df = pd.DataFrame({'Status': ['Hospitalized', 'Not Hospitalized'], 'Count': [[hospitalized_dict['Y']], [hospitalized_dict['N']]]})
+    counts = hospitalised_counts.reindex(['Y', 'N'], fill_value = 0)
 
     fig, ax = plt.subplots()
-    ax.bar(hospitalized_df['Status'], hospitalized_df['Count'], color = 'teal')
+    ax.bar(['Hospitalized', 'Not Hospitalized'], counts.values, color = 'teal')
     ax.set_ylabel('Number of People')
     fig.set_figheight(7)
 
     # Changing graph height based on current numbers
-    hospital_graph_max = max([x[0] for x in hospitalized_df['Count'].to_dict().values()])
+    hospital_graph_max = counts.max()
     ax.set(ylim=(0, hospital_graph_max * 1.5))
 
     return (fig, ax)
 
 
 # ----------------- HELPER FUNCTIONS ---------------- #
-def get_daily_increases(df: pd.DataFrame, countries: list[str], cases: list[int]):
-    '''Returns merged dataframe containing countries and their daily case increase'''
-    
-    daily_increase = dict()
-    for country in df['Country'].unique():
-        country_data = df[df['Country'] == country]
-        if country == 'Democratic Republic Of The Congo':
-            country = 'Dem. Rep. Congo'
-        if country == 'United Kingdom':
-            country = 'England'
-        daily_increase[country] = country_data.tail()['Cases'].loc[country_data.index[-1]]
-    
-    daily_increase = {'Country': daily_increase.keys(), 'Increase From Yesterday': daily_increase.values()}
-    daily_increase = pd.DataFrame.from_dict(daily_increase)
-
-    counts_data = {'Country Name                                  ': countries, 'Cases  ': [int(i) for i in cases]}
-    counts_df = pd.DataFrame.from_dict(counts_data)
-
-    merged = counts_df.merge(daily_increase, how = 'left', left_on = 'Country Name                                  ',
-        right_on = 'Country')
-    merged = merged.drop('Country', axis = 1)
+@metrics.timed
+def cumulative_chart_data(df: pd.DataFrame, max_points: int = MAX_CHART_POINTS):
+    '''Returns the plotted columns of a per-country timeseries, downsampled to fit max_points
+
+    Each country gets an equal share of the budget, so the chart payload stays flat
+    as more countries are selected. Series are reduced with LTTB, which keeps the
+    points that define the shape of each curve.
+    '''
+
+    df = df[['Date', 'Country', 'Cumulative Cases']]
+    df = df.assign(Country = df['Country'].astype(str))
+    n_countries = df['Country'].nunique()
+    if len(df) <= max_points or n_countries == 0:
+        return df
+
+    # LTTB needs at least the two end points and one interior point
+    per_country = max(max_points // n_countries, 3)
+    kept = []
+    for _, country_df in df.groupby('Country', sort = False):
+        country_df = country_df.sort_values('Date')
+        x = country_df['Date'].values.astype('int64').astype(float)
+        y = country_df['Cumulative Cases'].values.astype(float)
+        kept.append(country_df.iloc[lttb(x, y, per_country)])
+
+    return pd.concat(kept, ignore_index = True)
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int):
+    '''Returns indices of the points kept by Largest-Triangle-Three-Buckets downsampling'''
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x - x[0]
+
+    # First and last points are always kept; the rest are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = [0]
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        # Keep the bucket's point forming the largest triangle with its neighbors
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(area.argmax())
+        kept.append(previous)
+    kept.append(n - 1)
+
+    return np.array(kept)
+
+def country_case_lists(country_counts: pd.Series):
+    '''Returns (names, values) lists of linelist case counts per country, largest first.
+
+    country_counts is indexed by Country Key (see aggregates.CaseAggregates.country).
+    '''
+
+    country_counts = country_counts.sort_values(ascending = False, kind = 'stable')
+    names = pd.Series(countries.names(country_counts.index.values)).replace(countries.SHORT_NAMES)
+
+    return names.tolist(), country_counts.tolist()
+
+@metrics.timed
+def get_daily_increases(latest: pd.Series, country_counts: pd.Series):
+    '''Returns merged dataframe containing countries and their daily case increase
+
+    latest holds each timeseries country's most recent daily increase and
+    country_counts each country's linelist cases, both indexed by Country Key
+    (see timeseries_store.CountryTimeseries.latest and aggregates.CaseAggregates.country).
+    '''
+
+    country_counts = country_counts.sort_values(ascending = False, kind = 'stable')
+    names, cases = country_case_lists(country_counts)
+    counts_data = {'Country Name                                  ': names, 'Cases  ': [int(i) for i in cases]}
+    merged = pd.DataFrame.from_dict(counts_data)
+
+    # Timeseries countries are matched to the country the linelist reports them under;
+    # when two land on one, the later wins
+    latest = latest.set_axis(countries.linelist_keys(latest.index.values))
+    latest = latest[~latest.index.duplicated(keep = 'last')]
+
+    # Key lookup instead of scanning the timeseries once per country
+    merged['Increase From Yesterday'] = pd.Series(country_counts.index.values).map(latest).values
     merged['Increase From Yesterday'] = merged['Increase From Yesterday'].fillna('Not Available')
 
     merged.index += 1
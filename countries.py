@@ -0,0 +1,247 @@
+# This module holds the canonical country index shared by the loaders, charts and maps.
+#
+# Every country the dashboard can show has one row in land_data/countries.csv: an
+# integer key, its name as spelled in the case data, its ISO3 code and the country it
+# is drawn as on the world map (the UK's nations are drawn as the United Kingdom).
+# data_loader resolves every country column to these keys as it loads, so later
+# joins, groupbys and map merges compare small integers instead of names. Countries
+# the table does not list (territories without a shape of their own, such as
+# Gibraltar) are keyed after it, in the order each process first meets them, so keys
+# are never stored: snapshots and prepared geometry keep names and are keyed again
+# when loaded. Rebuild the table from the Natural Earth shapefile with:
+# python countries.py
+
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+TABLE_PATH = 'land_data/countries.csv'
+
+# Key of blank country names, and the name it is shown as
+UNKNOWN = -1
+UNKNOWN_NAME = 'Unknown'
+
+# Country names shortened wherever they are displayed
+SHORT_NAMES = {
+    'Democratic Republic Of The Congo': 'Dem. Rep. Congo',
+}
+
+# Timeseries countries whose cases the linelist reports under another country
+LINELIST_COUNTRIES = {
+    'United Kingdom': 'England',
+}
+
+# Natural Earth map names spelled as in the case data
+NATURAL_EARTH_NAMES = {
+    'United States of America': 'United States',
+    'Bosnia and Herz.': 'Bosnia And Herzegovina',
+    'Congo': 'Republic of Congo',
+    'Dem. Rep. Congo': 'Democratic Republic Of The Congo',
+    'Dominican Rep.': 'Dominican Republic',
+    'Central African Rep.': 'Central African Republic',
+    'Czechia': 'Czech Republic',
+    'Cayman Is.': 'Cayman Islands',
+}
+
+# Countries reported in the case data that have no shape of their own, with ISO 3166-2 codes
+EXTRA_COUNTRIES = {
+    'England': 'GB-ENG',
+    'Scotland': 'GB-SCT',
+    'Wales': 'GB-WLS',
+    'Northern Ireland': 'GB-NIR',
+}
+
+# Countries whose cases are drawn on another country's shape in the world map
+MAP_COUNTRIES = {
+    'England': 'United Kingdom',
+    'Scotland': 'United Kingdom',
+    'Wales': 'United Kingdom',
+    'Northern Ireland': 'United Kingdom',
+    'Cayman Islands': 'United Kingdom',
+}
+
+# Names of the countries keyed after the table, in key order, and their keys by casefolded name
+_extra_names = []
+_extra_keys = dict()
+_extra_lock = threading.Lock()
+
+
+@lru_cache(maxsize = None)
+def table() -> pd.DataFrame:
+    '''Returns the country index: Country, ISO3, Map Country and Map Key, indexed by key.
+
+    Read once per process and shared by every caller; the result must not be modified.
+    '''
+
+    df = pd.read_csv(TABLE_PATH, index_col = 'Key', keep_default_na = False)
+    df['Map Key'] = _lookup(df['Map Country'], dict(zip(df['Country'].str.casefold(), df.index)))
+    return df
+
+
+def keys(names) -> np.ndarray:
+    '''Returns the key of each country name, matched case-insensitively; UNKNOWN if not indexed'''
+
+    return _lookup(names, _name_keys())
+
+
+def iso3_keys(codes) -> np.ndarray:
+    '''Returns the key of each ISO3 code; UNKNOWN if not indexed'''
+
+    return _lookup(codes, _iso3_keys())
+
+
+def encode(names: pd.Series, iso3: pd.Series = None) -> tuple:
+    '''Returns (canonical names, keys) of a column of country names.
+
+    Names are resolved per distinct value, so the per-row cost is an integer lookup.
+    Names the index does not know keep their spelling and are keyed by their iso3
+    code where one is given, or else by a key of their own after the table's.
+    Blank names are keyed UNKNOWN.
+    '''
+
+    country = names.astype('category')
+    categories = country.cat.categories
+    category_keys = keys(categories)
+
+    # Canonical spelling of every category; aliases can merge two categories into one
+    known = category_keys != UNKNOWN
+    canonical = np.asarray(categories, dtype = object).copy()
+    canonical[known] = table()['Country'].values[category_keys[known]]
+    merged_codes, merged = pd.factorize(canonical)
+    codes = country.cat.codes.values
+    canonical_names = pd.Categorical.from_codes(np.where(codes >= 0, merged_codes[codes], -1), merged)
+
+    row_keys = np.append(category_keys, np.int16(UNKNOWN))[codes]
+    if iso3 is not None:
+        unknown = row_keys == UNKNOWN
+        if unknown.any():
+            row_keys[unknown] = iso3_keys(iso3[unknown])
+
+    unknown = row_keys == UNKNOWN
+    if unknown.any():
+        row_keys[unknown] = extra_keys(canonical_names[unknown])
+
+    return pd.Series(canonical_names, index = names.index, name = names.name), row_keys
+
+
+def extra_keys(names) -> np.ndarray:
+    '''Returns the key of each name the table does not list, adding keys for new names.
+
+    Names are matched case-insensitively and keyed from len(table()) up, in the order
+    this process first meets them; blank names are keyed UNKNOWN.
+    '''
+
+    codes, uniques = pd.factorize(pd.Series(names).astype(object))
+    unique_keys = []
+    with _extra_lock:
+        for name in uniques:
+            name = str(name).strip()
+            if not name:
+                unique_keys.append(UNKNOWN)
+                continue
+            key = _extra_keys.get(name.casefold())
+            if key is None:
+                key = _extra_keys[name.casefold()] = len(table()) + len(_extra_names)
+                _extra_names.append(name)
+            unique_keys.append(key)
+    return np.append(np.array(unique_keys, dtype = np.int16), np.int16(UNKNOWN))[codes]
+
+
+def extra_names(country_keys: np.ndarray) -> dict:
+    '''Returns {key: name} of the keys past the table's, to send keys to another process'''
+
+    country_keys = np.asarray(country_keys, dtype = np.int64)
+    extra = np.unique(country_keys[country_keys >= len(table())])
+    return dict(zip(extra.tolist(), names(extra)))
+
+
+def rekey(country_keys: np.ndarray, extra: dict) -> np.ndarray:
+    '''Returns keys received from another process as this process's keys.
+
+    extra is the sender's extra_names of the keys; the table's keys are shared by
+    every process and returned as they are.
+    '''
+
+    country_keys = np.array(country_keys, dtype = np.int16)
+    if extra:
+        local = dict(zip(extra, extra_keys(list(extra.values()))))
+        received = country_keys >= len(table())
+        country_keys[received] = [local[key] for key in country_keys[received].tolist()]
+    return country_keys
+
+
+def map_keys(country_keys: np.ndarray) -> np.ndarray:
+    '''Returns the key of the country each country is drawn as on the world map.
+
+    Countries past the table have no shape and are drawn as UNKNOWN.
+    '''
+
+    country_keys = np.asarray(country_keys)
+    listed = np.where(country_keys < len(table()), country_keys, UNKNOWN)
+    return np.append(table()['Map Key'].values, np.int16(UNKNOWN))[listed]
+
+
+def names(country_keys: np.ndarray) -> np.ndarray:
+    '''Returns the canonical name of each key; UNKNOWN_NAME for UNKNOWN'''
+
+    with _extra_lock:
+        extra = list(_extra_names)
+    return np.concatenate([table()['Country'].values, extra, [UNKNOWN_NAME]]).astype(object)[country_keys]
+
+
+def linelist_keys(country_keys: np.ndarray) -> np.ndarray:
+    '''Returns the key the linelist reports each timeseries country's cases under'''
+
+    country_keys = np.array(country_keys, dtype = np.int16)
+    listed = country_keys < len(table())
+    country_keys[listed] = _linelist_keys()[country_keys[listed]]
+    return country_keys
+
+
+def build_table(shapefile: str) -> pd.DataFrame:
+    '''Returns the country index built from the Natural Earth countries shapefile'''
+
+    import geopandas
+
+    map_df = geopandas.read_file(shapefile, ignore_geometry = True)
+
+    # Natural Earth leaves ISO_A3 unset (-99) for a few countries; ADM0_A3 fills them in
+    iso3 = map_df['ISO_A3'].where(map_df['ISO_A3'] != '-99', map_df['ADM0_A3'])
+    df = pd.DataFrame({'Country': map_df['NAME'].replace(NATURAL_EARTH_NAMES), 'ISO3': iso3})
+    df = pd.concat([df, pd.DataFrame({'Country': list(EXTRA_COUNTRIES), 'ISO3': list(EXTRA_COUNTRIES.values())})])
+
+    df = df.sort_values('Country', key = lambda names: names.str.casefold()).reset_index(drop = True)
+    df['Map Country'] = df['Country'].replace(MAP_COUNTRIES)
+    return df.rename_axis('Key')
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+@lru_cache(maxsize = None)
+def _name_keys():
+    name_keys = {name.casefold(): key for key, name in table()['Country'].items()}
+    for alias, name in NATURAL_EARTH_NAMES.items():
+        name_keys.setdefault(alias.casefold(), name_keys[name.casefold()])
+    return name_keys
+
+@lru_cache(maxsize = None)
+def _linelist_keys():
+    linelist_keys = np.arange(len(table()), dtype = np.int16)
+    linelist_keys[keys(list(LINELIST_COUNTRIES))] = keys(list(LINELIST_COUNTRIES.values()))
+    return np.append(linelist_keys, np.int16(UNKNOWN))
+
+@lru_cache(maxsize = None)
+def _iso3_keys():
+    return {iso3.casefold(): key for key, iso3 in table()['ISO3'].items()}
+
+def _lookup(values, mapping):
+    # Looks up each distinct value once and spreads the keys over the rows by code
+    codes, uniques = pd.factorize(pd.Series(values).astype(object))
+    unique_keys = [mapping.get(str(value).casefold(), UNKNOWN) for value in uniques]
+    return np.append(np.array(unique_keys, dtype = np.int16), np.int16(UNKNOWN))[codes]
+
+
+if __name__ == '__main__':
+    build_table('land_data/country_map/ne_50m_admin_0_countries.shp').to_csv(TABLE_PATH)
+    print(f'Wrote {TABLE_PATH}')
@@ -1,33 +1,411 @@
 # This module loads the necessary data from csv files.
 
+import hashlib
+import io
+import os
+from functools import wraps
+
 import pandas as pd
+from pandas.api.types import union_categoricals
 
-def load_full_data():
-    df = pd.read_csv('https://raw.githubusercontent.com/globaldothealth/monkeypox/b354c74499ea6583b5d0b2d4c65dcd486ed86395/latest_deprecated.csv')
+import countries
+import data_service
+import fetch
+import metrics
+import snapshots
+import updates
+from aggregates import AGGREGATE_COLUMNS, CaseAggregates
+from cache import DataCache
+from rollups import Rollups
+from timeseries_store import CountryTimeseries
 
-    df.drop(['Source', 'Source_II', 'Source_III', 'Source_IV', 'Source_V', 'Source_VI', 'Source_VII',
-        'ID', 'Contact_ID', 'Contact_comment', 'Date_last_modified'], axis = 1, inplace = True)
-    df = df[(df['Status'] == 'confirmed') | (df['Status'] == 'suspected')]
+# Host serving the upstream files (point at a local stand-in server for testing)
+UPSTREAM = os.environ.get('MPX_UPSTREAM', 'https://raw.githubusercontent.com')
+GLOBAL_HEALTH = f'{UPSTREAM}/globaldothealth/monkeypox/b354c74499ea6583b5d0b2d4c65dcd486ed86395'
 
-    return df
+# Upstream csv files, keyed by the name of their local snapshot
+SOURCES = {
+    'linelist': f'{GLOBAL_HEALTH}/latest_deprecated.csv',
+    'cumulative_cases': f'{GLOBAL_HEALTH}/timeseries-country-confirmed-deprecated.csv',
+    'total_cases': f'{GLOBAL_HEALTH}/timeseries-confirmed-deprecated.csv',
+    'state_cases': f'{UPSTREAM}/gridviz/monkeypox/main/data/processed/monkeypox_cases_states_cdc_latest.csv',
+}
+
+# Datasets that only grow by new dates, so they can be refreshed incrementally
+TIMESERIES = ['cumulative_cases', 'total_cases']
+
+# Declared schema of each dataset, pushed into the csv reader so unused columns and
+# rows are never materialized. Columns missing upstream are skipped.
+#   columns:    the only columns read
+#   dtypes:     dtypes applied while parsing ('category' for low-cardinality text)
+#   dates:      columns parsed as dates
+#   integers:   numeric columns downcast to 32-bit integers where they fit
+#   filters:    rows kept only when the column holds one of the listed values
+#   renames:    columns renamed for readability
+SCHEMAS = {
+    'linelist': {
+        'columns': ['Status', 'Country', 'Country_ISO3', 'Age', 'Gender', 'Symptoms', 'Hospitalised (Y/N/NA)',
+            'Date_onset', 'Date_confirmation', 'Date_entry'],
+        'dtypes': {'Status': 'category', 'Country': 'category', 'Country_ISO3': 'category', 'Age': 'category',
+            'Gender': 'category', 'Hospitalised (Y/N/NA)': 'category'},
+        'dates': ['Date_onset', 'Date_confirmation', 'Date_entry'],
+        'integers': [],
+        'filters': {'Status': ('confirmed', 'suspected')},
+        'renames': {},
+    },
+    'cumulative_cases': {
+        'columns': ['Date', 'Country', 'Country_ISO3', 'Cases', 'Cumulative_cases'],
+        'dtypes': {'Country': 'category', 'Country_ISO3': 'category'},
+        'dates': ['Date'],
+        'integers': ['Cases', 'Cumulative_cases'],
+        'filters': {},
+        'renames': {'Cumulative_cases': 'Cumulative Cases'},
+    },
+    'total_cases': {
+        'columns': ['Date', 'Cases', 'Cumulative_cases'],
+        'dtypes': {},
+        'dates': ['Date'],
+        'integers': ['Cases', 'Cumulative_cases'],
+        'filters': {},
+        'renames': {'Cumulative_cases': 'Cumulative Cases'},
+    },
+    'state_cases': {
+        'columns': ['state', 'cases'],
+        'dtypes': {},
+        'dates': [],
+        'integers': ['cases'],
+        'filters': {},
+        'renames': {},
+    },
+}
+
+# Rows parsed per chunk while filtering the linelist
+CHUNK_SIZE = 50_000
+
+# One cache per process, shared by every Streamlit session
+_cache = DataCache()
+
+# Loaders computed by the data service for every worker process (see data_service.py)
+SERVED = set()
+
+# Data version last seen from the data service
+_service_version = None
 
+def _served(func):
+    '''Decorator forwarding func to the data service when one is configured'''
+
+    SERVED.add(func.__name__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if data_service.enabled():
+            try:
+                return data_service.call(func.__name__, *args, **kwargs)
+            except ConnectionError:
+                pass
+        return func(*args, **kwargs)
+
+    return wrapper
+
+@metrics.timed
+@_cache.cached
+def load_full_data():
+    if snapshots.exists('linelist'):
+        return with_country_keys(snapshots.read('linelist'))
+    return read_dataset('linelist')
+
+# The full case frames stay in the process that loads them; workers of the data
+# service get the compact results below instead
+@metrics.timed
+@_cache.cached
 def load_cumulative_cases():
-    df = pd.read_csv('https://raw.githubusercontent.com/globaldothealth/monkeypox/b354c74499ea6583b5d0b2d4c65dcd486ed86395/timeseries-country-confirmed-deprecated.csv')
-    
-    # Formatting information for readability
-    df.rename(columns = {'Cumulative_cases': 'Cumulative Cases'}, inplace = True)
-    return df
+    if snapshots.exists('cumulative_cases'):
+        return with_country_keys(snapshots.read('cumulative_cases'))
+    return read_dataset('cumulative_cases')
 
+@metrics.timed
+@_cache.cached
 def load_total_cases():
-    df = pd.read_csv('https://raw.githubusercontent.com/globaldothealth/monkeypox/b354c74499ea6583b5d0b2d4c65dcd486ed86395/timeseries-confirmed-deprecated.csv')
+    if snapshots.exists('total_cases'):
+        return snapshots.read('total_cases')
+    return read_dataset('total_cases')
+
+@metrics.timed
+@_cache.cached
+@_served
+def load_state_cases():
+    if snapshots.exists('state_cases'):
+        return snapshots.read('state_cases')
+    return read_dataset('state_cases')
+
+# Returns the per-country timeseries partitioned for fast country selection
+@metrics.timed
+@_cache.cached
+@_served
+def load_country_timeseries():
+    return CountryTimeseries(load_cumulative_cases())
+
+# Returns the headline figures: the latest date with data and the current total
+@metrics.timed
+@_cache.cached
+@_served
+def load_summary():
+    total_df = load_total_cases()
+    last_updated = load_cumulative_cases()['Date'].max()
+
+    # Recorded so pages can show the date before (or without) loading any data
+    snapshots.write_last_date(last_updated.strftime('%Y-%m-%d'))
+    return {
+        'last_updated': last_updated,
+        'total': int(total_df['Cumulative Cases'].iloc[-1]),
+    }
+
+# Returns the global and per-country case counts rolled up by day, week and month
+@metrics.timed
+@_cache.cached
+@_served
+def load_rollups():
+    return Rollups(load_total_cases(), load_country_timeseries())
+
+# Returns linelist counts without keeping the linelist itself in memory
+@metrics.timed
+@_cache.cached
+@_served
+def load_aggregates():
+    if snapshots.exists('linelist'):
+        case_aggregates = CaseAggregates()
+        case_aggregates.add(with_country_keys(snapshots.read('linelist')))
+        return case_aggregates
+    return stream_aggregates('linelist')
+
+# Returns a short hash of the loaded data, used to key caches of derived results
+@metrics.timed
+@_cache.cached
+@_served
+def data_version():
+    case_aggregates = load_aggregates()
+    parts = [load_cumulative_cases(), load_total_cases(), load_state_cases()]
+    parts += [case_aggregates.breakdown(key) for key in AGGREGATE_COLUMNS]
+
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(pd.util.hash_pandas_object(part).values.tobytes())
+    return digest.hexdigest()[:12]
+
+# Downloads every source without a snapshot concurrently, returning {name: local path}
+@metrics.timed
+@_cache.cached
+@_served
+def prefetch():
+    missing = {name: url for name, url in SOURCES.items() if not snapshots.exists(name)}
+    return fetch.fetch_all(missing)
+
+# Drops all cached data so the next load fetches it again
+def refresh():
+    _cache.clear()
+
+# Drops cached results once the data service has loaded newer data
+def sync():
+    global _service_version
+    if not data_service.enabled():
+        return
+    try:
+        version = data_service.call('data_version')
+    except ConnectionError:
+        return
+    if version != _service_version:
+        _service_version = version
+        refresh()
+
+# Returns hit/miss/load-time counters for the data cache
+def cache_stats():
+    return _cache.stats()
+
+# Brings local data up to date and swaps it in for every session at once
+@metrics.timed
+@_served
+def refresh_data():
+    rebuild()
+
+# Returns the number of times the cached data was dropped or swapped
+def generation():
+    return _cache.generation
+
+# Reloads every dataset and aggregate into a staged cache, then swaps them all in at
+# once, so sessions keep reading the old data until the new data is complete
+@metrics.timed
+def rebuild():
+    with _cache.staging():
+        if any(snapshots.exists(name) for name in TIMESERIES):
+            update_timeseries()
+        prefetch()
+        load_country_timeseries()
+        load_summary()
+        load_rollups()
+        data_version()
+
+# Converts every upstream csv into a local snapshot and returns their names
+def build_snapshots():
+    for name in SOURCES:
+        if name not in TIMESERIES:
+            write_snapshot(name, read_dataset(name))
+    update_timeseries()
+    refresh()
+
+    return list(SOURCES)
+
+# Updates the timeseries snapshots with only the rows added upstream since the last fetch
+@metrics.timed
+def update_timeseries():
+    results = dict()
+    for name in TIMESERIES:
+        meta = snapshots.read_meta(name) if snapshots.exists(name) else None
+        kind, data, new_meta = updates.fetch_changes(SOURCES[name], meta, fetch.SESSION)
+
+        df = None
+        if kind == 'full':
+            df = read_dataset(name, io.BytesIO(data))
+            write_snapshot(name, df)
+        elif kind == 'append':
+            df = with_country_keys(snapshots.read(name))
+            new_rows = read_dataset(name, io.BytesIO(data))
+
+            # Rows are matched per country and date, so a country reporting late for an
+            # earlier date is still added; rows already in the snapshot are skipped
+            key = [column for column in ('Country', 'Date') if column in df.columns]
+            seen = pd.MultiIndex.from_frame(df[key])
+            new_rows = new_rows[~pd.MultiIndex.from_frame(new_rows[key]).isin(seen)]
+            new_rows = new_rows.drop_duplicates(key, keep = 'last')
+            if len(new_rows) > 0:
+                df = concat_chunks([df, new_rows]).sort_values('Date', kind = 'stable', ignore_index = True)
+                write_snapshot(name, df)
+
+        # Recorded so pages can show the date without loading data (see load_summary)
+        if name == 'cumulative_cases' and df is not None and len(df) > 0:
+            snapshots.write_last_date(df['Date'].max().strftime('%Y-%m-%d'))
+
+        snapshots.write_meta(name, new_meta)
+        results[name] = kind
+
+    return results
+
+
+# Returns a dataframe comparing memory use of a plain read against the declared schema
+def schema_report():
+    rows = []
+    for name in SOURCES:
+        naive_bytes = pd.read_csv(source_path(name)).memory_usage(deep = True).sum()
+        schema_bytes = read_dataset(name).memory_usage(deep = True).sum()
+        rows.append({'Dataset': name, 'Full Read (MB)': naive_bytes / 1e6, 'Schema Read (MB)': schema_bytes / 1e6,
+            'Saved (MB)': (naive_bytes - schema_bytes) / 1e6})
+
+    return pd.DataFrame(rows)
+
+
+# Reads a dataset chunk by chunk, folding each chunk into running aggregates
+@metrics.timed
+def stream_aggregates(name: str, source = None, chunksize: int = CHUNK_SIZE):
+    case_aggregates = CaseAggregates()
+    for chunk in read_chunks(name, source, chunksize):
+        case_aggregates.add(chunk)
+
+    return case_aggregates
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+@metrics.timed
+def read_dataset(name: str, source = None):
+    '''Reads a dataset from its csv source using the declared schema'''
+
+    schema = SCHEMAS[name]
+    df = concat_chunks(list(read_chunks(name, source)), name)
+
+    for column in schema['dates']:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors = 'coerce')
+    for column in schema['integers']:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast = 'integer')
+
+            # Keep at least 32 bits so sums and daily increments cannot overflow
+            if df[column].dtype.kind == 'i' and df[column].dtype.itemsize < 4:
+                df[column] = df[column].astype('int32')
+
+    return df.rename(columns = schema['renames'])
+
+def source_path(name: str):
+    '''Returns the prefetched local copy of a source, or its URL when it was not prefetched'''
+
+    return prefetch().get(name, SOURCES[name])
+
+def read_chunks(name: str, source = None, chunksize: int = CHUNK_SIZE):
+    '''Yields the filtered, column-pruned chunks of a dataset's csv source'''
+
+    schema = SCHEMAS[name]
+    columns = schema['columns']
+
+    reader = pd.read_csv(source or source_path(name), usecols = lambda column: column in columns,
+        dtype = schema['dtypes'], chunksize = chunksize)
+
+    # Filter each chunk as it is parsed so dropped rows are never held together
+    for chunk in reader:
+        for column, values in schema['filters'].items():
+            chunk = chunk[chunk[column].isin(values)]
+        yield with_country_keys(chunk)
+
+def empty_frame(name: str = None):
+    '''Returns an empty frame with the columns and parsed dtypes of a dataset's schema'''
+
+    if name is None:
+        return pd.DataFrame()
+
+    schema = SCHEMAS[name]
+    dtypes = {column: 'object' for column in schema['columns']}
+    dtypes.update(schema['dtypes'])
+    dtypes.update({column: 'datetime64[ns]' for column in schema['dates']})
+    dtypes.update({column: 'int32' for column in schema['integers']})
+    df = pd.DataFrame({column: pd.Series(dtype = dtype) for column, dtype in dtypes.items()})
+    return with_country_keys(df)
+
+def with_country_keys(df: pd.DataFrame):
+    '''Returns df with its Country names made canonical and keyed in a Country Key column.
+
+    Applied as every frame is loaded, so downstream joins and groupbys use the
+    integer keys (see countries.py). Keys are valid in this process only and are
+    never stored: a Country Key column read back from disk is replaced. Frames
+    without a Country column are returned as they are.
+    '''
+
+    if 'Country' not in df.columns:
+        return df
+
+    names, keys = countries.encode(df['Country'], df.get('Country_ISO3'))
+    return df.assign(**{'Country': names, 'Country Key': keys})
+
+def write_snapshot(name: str, df: pd.DataFrame):
+    '''Writes a dataset snapshot without its per-process Country Key column'''
+
+    snapshots.write(name, df.drop(columns = 'Country Key', errors = 'ignore'))
+
+def concat_chunks(chunks: list[pd.DataFrame], name: str = None):
+    '''Concatenates csv chunks, merging the per-chunk categories of categorical columns.
+
+    With no chunks, returns an empty frame typed as the named dataset's schema.
+    '''
+
+    if not chunks:
+        return empty_frame(name)
+
+    df = pd.concat(chunks, ignore_index = True)
+
+    # pd.concat falls back to object dtype when chunk categories differ
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([chunk[column] for chunk in chunks])
+            df[column] = pd.Series(categories, index = df.index).cat.remove_unused_categories()
 
-    # Formatting information for readability
-    df.rename(columns = {'Cumulative_cases': 'Cumulative Cases'}, inplace = True)
     return df
 
-# Returns all of the dataframes concisely
-def load_all():
-    cum_df = load_cumulative_cases()
-    date_df = pd.to_datetime(cum_df['Date']).sort_values(ascending = False)
 
-    return [load_full_data(), cum_df, load_total_cases(), date_df]
\ No newline at end of file
+if __name__ == '__main__':
+    print(schema_report().to_string(index = False))
@@ -0,0 +1,187 @@
+# This module shares one copy of the loaded data between every dashboard process.
+#
+# Run the service once per host:
+#
+#   MPX_DATA_SERVICE=data_cache/data.sock python data_service.py
+#
+# and start any number of Streamlit workers with the same MPX_DATA_SERVICE. The
+# service owns downloading, parsing and aggregation; workers receive the compact
+# results (headline totals, timeseries arrays, global rollups, linelist counts, state
+# cases, data version) over a local socket instead of loading the sources themselves.
+# A worker that cannot reach the service falls back to loading in-process.
+#
+# Map geometry is not served: every worker loads its own copy (see geometry.py) and
+# merges the served counts onto it. Every worker also keeps its own copy of the
+# served timeseries arrays.
+#
+# MPX_DATA_SERVICE is a unix socket path, or host:port for a TCP socket. Messages are
+# pickles, so only authenticated workers are accepted: with MPX_DATA_SERVICE_KEY unset,
+# the service generates a key and stores it beside its socket, readable only by the
+# user running it, and workers read it from there. A TCP socket requires
+# MPX_DATA_SERVICE_KEY to be set for the service and every worker.
+
+import logging
+import os
+import secrets
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# Address of the data service; unset loads data in-process
+ADDRESS = os.environ.get('MPX_DATA_SERVICE', '')
+
+# Socket the service listens on when MPX_DATA_SERVICE is unset
+DEFAULT_ADDRESS = 'data_cache/data.sock'
+
+# Shared secret that authenticates workers to the service; unset, the service generates one
+KEY = os.environ.get('MPX_DATA_SERVICE_KEY', '').encode()
+
+# Seconds a worker loads in-process before trying an unreachable service again
+RETRY_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+# True inside the service process itself, which must load rather than forward
+serving = False
+
+_lock = threading.Lock()
+_connection = None
+_unreachable_until = 0.0
+
+
+class ServiceError(Exception):
+    '''Raised when the service failed to compute a result'''
+
+
+def enabled() -> bool:
+    '''Returns whether this process should forward loads to the service'''
+
+    return bool(ADDRESS) and not serving and time.monotonic() >= _unreachable_until
+
+
+def call(name: str, *args, **kwargs):
+    '''Returns the result of data_loader.<name>(*args, **kwargs) computed by the service.
+
+    Raises ConnectionError when the service cannot be reached; the caller then
+    loads in-process.
+    '''
+
+    global _connection, _unreachable_until
+    with _lock:
+        try:
+            if _connection is None:
+                _connection = Client(parse_address(ADDRESS), authkey = authkey(ADDRESS))
+            _connection.send((name, args, kwargs))
+            ok, result = _connection.recv()
+        except (OSError, EOFError, AuthenticationError, ValueError) as error:
+            _connection = None
+            _unreachable_until = time.monotonic() + RETRY_SECONDS
+            logger.warning('Data service at %s unreachable (%s); loading in-process', ADDRESS, error)
+            raise ConnectionError(error) from error
+
+    if not ok:
+        raise ServiceError(result)
+    return result
+
+
+def serve(address: str = ADDRESS):
+    '''Loads the data, then serves data_loader results to workers until interrupted'''
+
+    global serving
+    key = authkey(address, create = True)
+    serving = True
+    import data_loader
+
+    # Load everything before accepting workers, so the first ones do not wait
+    data_loader.prefetch()
+    data_loader.data_version()
+    data_loader.load_country_timeseries()
+
+    # Keeps the data fresh for every worker; they pick it up through data_loader.sync
+    import refresher
+    refresher.start()
+
+    family = 'AF_UNIX' if isinstance(parse_address(address), str) else 'AF_INET'
+    if family == 'AF_UNIX' and os.path.exists(address):
+        os.remove(address)
+
+    with Listener(parse_address(address), family = family, authkey = key) as listener:
+        if family == 'AF_UNIX':
+            os.chmod(address, 0o600)
+        logger.info('Serving dashboard data on %s', address)
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError as error:  # a client failing authentication, for instance
+                logger.warning('Rejected data service connection: %s', error)
+                continue
+            threading.Thread(target = _handle, args = (connection, data_loader), daemon = True).start()
+
+
+def parse_address(address: str):
+    '''Returns a multiprocessing.connection address: a (host, port) tuple or a socket path'''
+
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+def authkey(address: str, create: bool = False) -> bytes:
+    '''Returns the key authenticating workers to the service at address.
+
+    That is MPX_DATA_SERVICE_KEY when set. Otherwise it is the key stored beside the
+    unix socket, which create=True (the service) generates first. Raises ValueError
+    for a TCP address without MPX_DATA_SERVICE_KEY.
+    '''
+
+    if KEY:
+        return KEY
+    if not isinstance(parse_address(address), str):
+        raise ValueError(f'A data service on TCP ({address}) requires MPX_DATA_SERVICE_KEY')
+
+    key_path = address + '.key'
+    if create:
+        key = secrets.token_hex(32).encode()
+        os.makedirs(os.path.dirname(key_path) or '.', exist_ok = True)
+        tmp_path = key_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+            f.write(key)
+        os.replace(tmp_path, key_path)
+        return key
+
+    with open(key_path, 'rb') as f:
+        return f.read()
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _handle(connection, data_loader):
+    with connection:
+        while True:
+            try:
+                name, args, kwargs = connection.recv()
+            except (OSError, EOFError):
+                return
+
+            if name not in data_loader.SERVED:
+                connection.send((False, f'{name} is not served'))
+                continue
+            try:
+                connection.send((True, getattr(data_loader, name)(*args, **kwargs)))
+            except Exception as error:
+                logger.exception('Data service failed to compute %s', name)
+                connection.send((False, f'{name} failed: {error!r}'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+
+    # Serve through the imported module, whose serving flag data_loader reads
+    import data_service
+    try:
+        data_service.serve(ADDRESS or DEFAULT_ADDRESS)
+    except ValueError as error:
+        raise SystemExit(str(error))
@@ -0,0 +1,203 @@
+# Renders the whole dashboard into a static bundle that any static file server can host.
+#
+# Data is loaded once; every chart and map is written as a PNG, the cumulative case
+# chart as Vega-Lite JSON specs (all default countries plus one per country), and the
+# cumulative case table as HTML, tied together by an index.html. A manifest records
+# a hash of each asset's inputs so --changed-only rewrites only assets whose data
+# changed:
+#
+#   python export.py --out static_site [--changed-only]
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pandas as pd
+
+import charts
+import countries
+import data_loader
+import maps
+import pages
+import render_cache
+
+MANIFEST = 'manifest.json'
+
+# Code (and the country index) that draws the assets; editing it invalidates every asset
+CODE_FILES = ['charts.py', 'maps.py', 'geometry.py', 'countries.py', countries.TABLE_PATH]
+
+
+def build_assets() -> dict:
+    '''Returns {relative path: (inputs, build)} for every asset in the bundle.
+
+    build() returns the asset's bytes; inputs is everything the asset depends on.
+    '''
+
+    total_df = data_loader.load_total_cases()
+    state_cases = data_loader.load_state_cases()
+    case_aggregates = data_loader.load_aggregates()
+    country_counts = case_aggregates.country
+    country_timeseries = data_loader.load_country_timeseries()
+    rollups = data_loader.load_rollups()
+    latest = country_timeseries.latest()
+    names, values = charts.country_case_lists(country_counts)
+
+    assets = {
+        'images/global_case_graph.png': ([total_df],
+            lambda: render_cache.figure_bytes(charts.global_case_graph(rollups)[0])),
+        'images/global_pie_chart.png': ([names, values],
+            lambda: render_cache.figure_bytes(charts.global_pie_chart(names, values)[0])),
+        'images/gender_chart.png': ([case_aggregates.gender],
+            lambda: render_cache.figure_bytes(charts.gender_chart(case_aggregates.gender)[0])),
+        'images/hospitalization_chart.png': ([case_aggregates.hospitalised],
+            lambda: render_cache.figure_bytes(charts.hospitalization_chart(case_aggregates.hospitalised)[0])),
+        'images/world_map.png': ([country_counts],
+            lambda: render_cache.figure_bytes(maps.world_map_figure(country_counts))),
+        'images/us_map.png': ([state_cases],
+            lambda: render_cache.figure_bytes(maps.us_map_figure(state_cases))),
+        'cumulative_case_table.html': ([latest, country_counts],
+            lambda: charts.get_daily_increases(latest, country_counts).to_html().encode()),
+    }
+
+    # Cumulative case chart for the default selection and for each country on its own
+    specs = {'Default': charts.DEFAULT_COUNTRIES}
+    specs.update({country: [country] for country in country_timeseries.countries()})
+    spec_index = dict()
+    for label, selection in specs.items():
+        spec_path = f'specs/{slug(label)}.json'
+        selection_df = country_timeseries.select(selection)
+        assets[spec_path] = ([selection_df], lambda df = selection_df: json.dumps(
+            charts.cumulative_case_chart(df).to_dict()).encode())
+        spec_index[label] = spec_path
+
+    summary = data_loader.load_summary()
+    curr_total = '{:,}'.format(summary['total'])
+    last_updated = summary['last_updated'].strftime(pages.DATE_FORMAT)
+    assets['specs/index.json'] = ([spec_index], lambda: json.dumps(spec_index).encode())
+    assets['index.html'] = ([curr_total, last_updated],
+        lambda: index_page(curr_total, last_updated).encode())
+
+    return assets
+
+
+def export(out_dir: str, changed_only: bool = False) -> list[str]:
+    '''Writes the static bundle to out_dir and returns the paths written'''
+
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = dict()
+    if changed_only and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    code_digest = digest([_read(path) for path in CODE_FILES])
+    written = []
+    for asset_path, (inputs, build) in build_assets().items():
+        input_digest = digest(inputs + [code_digest])
+        target = os.path.join(out_dir, asset_path)
+        if manifest.get(asset_path) == input_digest and os.path.exists(target):
+            continue
+
+        os.makedirs(os.path.dirname(target), exist_ok = True)
+        with open(target, 'wb') as f:
+            f.write(build())
+        manifest[asset_path] = input_digest
+        written.append(asset_path)
+
+    os.makedirs(out_dir, exist_ok = True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+
+    return written
+
+
+def index_page(curr_total: str, last_updated: str) -> str:
+    '''Returns the static dashboard page'''
+
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Monkeypox Dashboard</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-lite@4"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+<style>
+body {{background: #0e0b16; color: #c1c1c1; font-family: sans-serif; margin: 2rem;}}
+.grid {{display: grid; grid-template-columns: 1fr 1fr; gap: 2rem;}}
+img {{width: 100%;}}
+table {{border-collapse: collapse;}} td, th {{padding: 0.2rem 0.6rem; border-bottom: 1px solid #333;}}
+</style>
+</head>
+<body>
+<h1>Current Monkeypox (MPXV) Cases: {html.escape(curr_total)}</h1>
+<p>Data last updated {html.escape(last_updated)}. Data has now been deprecated.</p>
+
+<h2>Cumulative Cases by Country</h2>
+<select id="country"></select>
+<div id="chart"></div>
+
+<div class="grid">
+<div><h2>Cumulative Case Table</h2><div id="table"></div></div>
+<div><h2>Total Cases Globally</h2><img src="images/global_case_graph.png"></div>
+<div><h2>Breakdown of Global Cases</h2><img src="images/global_pie_chart.png"></div>
+<div><h2>Gender Distribution of Cases</h2><img src="images/gender_chart.png"></div>
+<div><h2>Hospitalization Rates</h2><img src="images/hospitalization_chart.png"></div>
+</div>
+
+<h2>Global Data</h2><img src="images/world_map.png">
+<h2>U.S. Data</h2><img src="images/us_map.png">
+
+<script>
+fetch('cumulative_case_table.html').then(r => r.text()).then(t => {{document.getElementById('table').innerHTML = t;}});
+fetch('specs/index.json').then(r => r.json()).then(specs => {{
+    const select = document.getElementById('country');
+    for (const label of Object.keys(specs)) {{
+        select.add(new Option(label, specs[label]));
+    }}
+    const show = () => vegaEmbed('#chart', select.value, {{theme: 'dark'}});
+    select.onchange = show;
+    show();
+}});
+</script>
+</body>
+</html>
+'''
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def digest(inputs: list) -> str:
+    '''Returns a hash of an asset's inputs'''
+
+    hasher = hashlib.sha1()
+    for item in inputs:
+        if isinstance(item, (pd.DataFrame, pd.Series)):
+            hasher.update(pd.util.hash_pandas_object(item).values.tobytes())
+        else:
+            hasher.update(repr(item).encode())
+    return hasher.hexdigest()
+
+
+def slug(label: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', label.lower()).strip('-')
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Export the dashboard as a static bundle.')
+    parser.add_argument('--out', default = 'static_site', help = 'output directory')
+    parser.add_argument('--changed-only', action = 'store_true',
+        help = 'only rewrite assets whose input data changed since the last export')
+    args = parser.parse_args()
+
+    written = export(args.out, args.changed_only)
+    print(f'Wrote {len(written)} assets to {args.out}')
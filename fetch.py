@@ -0,0 +1,93 @@
+# This module downloads the upstream csv files concurrently.
+#
+# Every source is fetched on its own thread through one pooled HTTP session, with a
+# per-source timeout and retries with exponential backoff. Each successful download
+# is kept on disk as the last good copy, which is used if the source later fails.
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+RAW_DIR = os.environ.get('MPX_RAW_DIR', 'data_cache/raw')
+
+# Seconds to wait for each source; the linelist is by far the largest file
+DEFAULT_TIMEOUT = 30
+TIMEOUTS = {'linelist': 120}
+
+RETRIES = 3
+BACKOFF = 0.5
+
+logger = logging.getLogger(__name__)
+
+# Pooled session shared by every download in the process
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections = 4, pool_maxsize = 8))
+SESSION.mount('http://', HTTPAdapter(pool_connections = 4, pool_maxsize = 8))
+
+
+def raw_path(name: str) -> str:
+    '''Returns the path of the last good local copy of a source'''
+
+    return os.path.join(RAW_DIR, f'{name}.csv')
+
+
+@metrics.timed
+def fetch_all(sources: dict) -> dict:
+    '''Downloads every {name: url} source concurrently and returns {name: local path}.
+
+    A source that cannot be downloaded falls back to its last good local copy; a
+    source with neither raises the download error.
+    '''
+
+    if not sources:
+        return dict()
+
+    with ThreadPoolExecutor(max_workers = len(sources)) as executor:
+        futures = {name: executor.submit(fetch_one, name, url) for name, url in sources.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+@metrics.timed
+def fetch_one(name: str, url: str) -> str:
+    '''Downloads one source with retries, returning the path of its local copy'''
+
+    timeout = TIMEOUTS.get(name, DEFAULT_TIMEOUT)
+    for attempt in range(RETRIES):
+        try:
+            _download(url, raw_path(name), timeout)
+            return raw_path(name)
+        except requests.RequestException as error:
+            last_error = error
+            if attempt < RETRIES - 1:
+                time.sleep(BACKOFF * 2 ** attempt)
+
+    if os.path.exists(raw_path(name)):
+        logger.warning('Fetching %s failed (%s); using last good copy', name, last_error)
+        return raw_path(name)
+    raise last_error
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _download(url, path, timeout):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    try:
+        with SESSION.get(url, timeout = timeout, stream = True) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for block in response.iter_content(chunk_size = 1 << 20):
+                    f.write(block)
+    except requests.RequestException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Only replace the last good copy once the download has completed
+    os.replace(tmp_path, path)
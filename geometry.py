@@ -0,0 +1,168 @@
+# This module prepares the map geometries once and loads them once per process.
+#
+# The Natural Earth and Census shapefiles are read, name-normalized, simplified and
+# given precomputed label centroids, then stored as GeoParquet in data_cache/geometry.
+# World countries are keyed with their countries.py key as they are loaded; keys are
+# never stored, since they follow the country table. Later loads read the prepared
+# files instead of parsing the shapefiles. The interactive maps' GeoJSON is written to
+# static/geometry for the browser to fetch. Build them ahead of time with:
+# python geometry.py
+
+import hashlib
+import json
+import os
+import warnings
+from functools import lru_cache
+
+import geopandas
+from shapely.geometry import MultiPolygon, Polygon
+from shapely.geometry.polygon import orient
+
+import countries
+import metrics
+
+GEOMETRY_DIR = os.environ.get('MPX_GEOMETRY_DIR', 'data_cache/geometry')
+
+# Source shapefile, simplification tolerance (degrees) and regions left off each map
+MAPS = {
+    'world': {
+        'shapefile': 'land_data/country_map/ne_50m_admin_0_countries.shp',
+        'tolerance': 0.01,
+        'excluded': ['Antarctica'],
+    },
+    'us': {
+        'shapefile': 'land_data/us_map/cb_2018_us_state_5m.shp',
+        'tolerance': 0.005,
+        'excluded': [],
+    },
+}
+
+# Simplification tolerance (degrees) of the vector geometry sent to the browser, per
+# zoom level; lower levels ship far smaller payloads
+ZOOM_TOLERANCES = {1: 0.2, 2: 0.05, 3: 0.01}
+
+# Directory Streamlit serves static files from (see .streamlit/config.toml), where the
+# browser's GeoJSON is written, and the URL the browser fetches it from
+STATIC_DIR = 'static/geometry'
+STATIC_URL = 'app/static/geometry'
+
+
+def path(name: str) -> str:
+    '''Returns the file path of the named prepared geometry'''
+
+    return os.path.join(GEOMETRY_DIR, f'{name}.parquet')
+
+
+@metrics.timed
+def prepare(name: str) -> geopandas.GeoDataFrame:
+    '''Builds the named map geometry from its shapefile and stores it'''
+
+    settings = MAPS[name]
+    map_df = geopandas.read_file(settings['shapefile'])
+
+    columns = ['NAME', 'geometry']
+    if 'ADM0_A3' in map_df.columns:
+        map_df['ISO3'] = map_df['ADM0_A3']
+        columns.insert(1, 'ISO3')
+    map_df = map_df[columns]
+
+    map_df = map_df[~map_df['NAME'].isin(settings['excluded'])]
+    if name == 'world':
+        map_df['NAME'] = map_df['NAME'].replace(countries.NATURAL_EARTH_NAMES)
+
+    # Label positions come from the full-detail shapes, as before simplification
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)  # centroids of geographic coordinates
+        centroids = map_df.geometry.centroid
+    map_df['centroid_x'], map_df['centroid_y'] = centroids.x, centroids.y
+    map_df['geometry'] = map_df.geometry.simplify(settings['tolerance'], preserve_topology = True)
+    map_df = map_df.reset_index(drop = True)
+
+    os.makedirs(GEOMETRY_DIR, exist_ok = True)
+    tmp_path = path(name) + '.tmp'
+    map_df.to_parquet(tmp_path)
+    os.replace(tmp_path, path(name))
+
+    return map_df
+
+
+@metrics.timed
+@lru_cache(maxsize = None)
+def load(name: str) -> geopandas.GeoDataFrame:
+    '''Returns the named prepared geometry, building it first if it is missing or stale.
+
+    The result is shared by every caller in the process and must not be modified.
+    '''
+
+    if os.path.exists(path(name)) and os.path.getmtime(path(name)) >= os.path.getmtime(MAPS[name]['shapefile']):
+        map_df = geopandas.read_parquet(path(name))
+    else:
+        map_df = prepare(name)
+
+    # Keyed on every load, so a rebuilt country table cannot leave stale keys behind
+    if name == 'world':
+        map_df['Country Key'] = countries.keys(map_df['NAME'])
+    return map_df
+
+
+@metrics.timed
+@lru_cache(maxsize = None)
+def geojson(name: str, zoom: int) -> dict:
+    '''Returns the named map as a GeoJSON FeatureCollection simplified for a zoom level.
+
+    Built once per process and zoom level; the result must not be modified.
+    '''
+
+    map_df = load(name)[['NAME', 'geometry']].copy()
+    map_df['geometry'] = map_df.geometry.simplify(ZOOM_TOLERANCES[zoom], preserve_topology = True)
+
+    # Browsers draw spherical shapes with d3-geo, which expects clockwise outer rings
+    map_df['geometry'] = map_df.geometry.apply(_clockwise)
+    features = json.loads(map_df.to_json(drop_id = True))
+
+    # Three decimals (~100 m) is finer than any zoom level's tolerance
+    for feature in features['features']:
+        feature['geometry']['coordinates'] = _round_coordinates(feature['geometry']['coordinates'])
+    return features
+
+
+@lru_cache(maxsize = None)
+def geojson_url(name: str, zoom: int) -> str:
+    '''Returns the URL the browser loads the named map's GeoJSON for a zoom level from.
+
+    The file is written once per process, so its shapes always match this process's
+    geometry; browsers fetch and cache it instead of receiving it on every rerun.
+    '''
+
+    file_name = f'{name}-{zoom}.json'
+    data = json.dumps(geojson(name, zoom), separators = (',', ':')).encode()
+    os.makedirs(STATIC_DIR, exist_ok = True)
+
+    # Every dashboard process writes the same file, so each writes its own temporary copy
+    tmp_path = os.path.join(STATIC_DIR, f'{file_name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, os.path.join(STATIC_DIR, file_name))
+
+    # The content hash makes browsers fetch the shapes again once they change
+    return f'{STATIC_URL}/{file_name}?v={hashlib.sha1(data).hexdigest()[:12]}'
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _clockwise(shape):
+    if isinstance(shape, Polygon):
+        return orient(shape, sign = -1.0)
+    if isinstance(shape, MultiPolygon):
+        return MultiPolygon([orient(part, sign = -1.0) for part in shape.geoms])
+    return shape
+
+def _round_coordinates(coordinates):
+    if isinstance(coordinates[0], (int, float)):
+        return [round(value, 3) for value in coordinates]
+    return [_round_coordinates(part) for part in coordinates]
+
+
+if __name__ == '__main__':
+    for name in MAPS:
+        prepare(name)
+        print(f'Wrote {path(name)}')
@@ -1,18 +1,30 @@
 # Libraries
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import streamlit as st
-import numpy as np
-import altair as alt
 from streamlit_option_menu import option_menu
-from st_aggrid import GridOptionsBuilder, AgGrid
 
 # Modules
-import data_loader
-import charts
-import maps
+import metrics
+import pages
+import refresher
+
+# data_loader and the page-specific libraries (pandas, altair, st_aggrid, geopandas,
+# ...) are imported by the pages that use them, so the static pages never pay for them
+
+
+# Times this rerun's data loading and chart building for the debug panel
+metrics.start_rerun()
+
+# Prometheus endpoint, started once per process when MPX_METRICS_PORT is set
+if metrics.METRICS_PORT:
+    def data_cache_metrics():
+        import data_loader
+        return {f'mpx_data_cache_{key}': value
+            for key, value in data_loader.cache_stats().items() if isinstance(value, (int, float))}
+
+    metrics.serve(metrics.METRICS_PORT, data_cache_metrics)
+
+# Reloads the data in the background every MPX_REFRESH_INTERVAL seconds (once per process)
+refresher.start()
 
 
 # ---------- Setting Up Webpage ---------- #
@@ -40,20 +52,28 @@ selected = option_menu(None, ['Home', 'Maps', 'Resources', 'Sources'],
     styles = {'nav-link': {'--hover-color': '#8E6FF9'}}
 )
 
+page = pages.page_name(selected)
+
 # ---------- Loading Data ---------- #
 
-# Initializing dataframes 
-dataframes = data_loader.load_all()
-full_df = dataframes[0]
-cum_df = dataframes[1]
-total_df = dataframes[2]
+# Imports the modules and loads the datasets this page declares (none for static pages)
+page_data = pages.load(page)
+
+if 'summary' in page_data:
+    case_aggregates = page_data['aggregates']
 
-# Gets date data was last updated
-date_df = dataframes[3]
-last_updated = list(date_df.dt.strftime('%b %d, %Y').head())[0]
+    # Identifies the loaded data, so unchanged charts are served from the render cache
+    data_version = page_data['data_version']
 
-# Dataframe with countries and their current cases
-country_counts = full_df['Country'].value_counts().to_frame()
+    # Gets date data was last updated, remembered for the Sources page
+    last_updated = page_data['summary']['last_updated'].strftime(pages.DATE_FORMAT)
+    st.session_state['last_updated'] = last_updated
+
+    # Countries' current cases, indexed by country key
+    country_counts = case_aggregates.country
+
+    # Getting cumulative cases
+    curr_total = '{:,}'.format(page_data['summary']['total'])
 
 
 # ---------- Sidebar ---------- #
@@ -62,18 +82,26 @@ st.sidebar.image('content/Monkeypox_Dashboard.png')
 st.sidebar.write('')
 st.sidebar.write('')
 
-# Filters
-st.sidebar.header('Data Filters')
-countries = st.sidebar.multiselect('Country Selection', 
-    options = list(cum_df['Country'].unique()),
-    default = ['United States', 'Germany', 'Spain', 'United Kingdom']
-)
+# ---------- Home Page ---------- #
+if page == 'Home':
+    from st_aggrid import GridOptionsBuilder, AgGrid
 
-# Getting cumulative cases
-curr_total = str('{:,}'.format(total_df['Cumulative Cases'][len(total_df)-1]))
+    import case_table
+    import charts
+    import render_cache
 
-# ---------- Home Page ---------- #
-if selected == '"Home"' or selected == 'Home':
+    # Per-country timeseries, partitioned once so country selections skip full scans
+    country_timeseries = page_data['country_timeseries']
+
+    # Case counts rolled up by day, week and month for the total cases graph
+    rollups = page_data['rollups']
+
+    # Filters
+    st.sidebar.header('Data Filters')
+    countries = st.sidebar.multiselect('Country Selection', 
+        options = country_timeseries.countries(),
+        default = charts.DEFAULT_COUNTRIES
+    )
 
     # Page Header
     st.write('# Current Monkeypox (MPXV) Cases: ' + curr_total)
@@ -81,61 +109,17 @@ if selected == '"Home"' or selected == 'Home':
     st.write('') 
     
     # Gets data for user-selected countries
-    selection_df = cum_df[cum_df['Country'].isin(countries)]
+    selection_df = country_timeseries.select(countries)
    
 
     # Line chart
-    nearest = alt.selection(type='single', nearest=True, on='mouseover',
-                            fields=['Date'], empty='none')
-
-    line_chart = alt.Chart(selection_df).mark_line(interpolate = 'basis').encode(
-        x = alt.X('Date', axis = alt.Axis(title = 'Date', tickMinStep = 2)),
-        y = 'Cumulative Cases',
-        color = 'Country'
-    )
-
-    selectors = alt.Chart(selection_df).mark_point().encode(
-        x = alt.X('Date', axis = alt.Axis(title = 'Date', tickMinStep = 2)),
-        opacity=alt.value(0),
-    ).add_selection(
-        nearest
-    )
-
-    points = line_chart.mark_point().encode(
-        opacity=alt.condition(nearest, alt.value(1), alt.value(0))
-    )
-
-    text = line_chart.mark_text(align='left', dx=5, dy=-5).encode(
-        text=alt.condition(nearest, 'Cumulative Cases', alt.value(' '))
-    )
-
-    rules = alt.Chart(selection_df).mark_rule(color='gray').encode(
-        x = alt.X('Date', axis = alt.Axis(title = 'Date', tickMinStep = 2))
-    ).transform_filter(
-        nearest
-    )
-
-    line_chart = alt.layer(
-        line_chart, selectors, points, rules, text
-    ).properties(
-        width=600, height=300
-    ).configure_axisX(labelAngle = 90).interactive()
+    line_chart = charts.cumulative_case_chart(selection_df)
 
     st.write('## Cumulative Cases by Country')
     st.write('Select countries to visualize on the left sidebar.')
     st.altair_chart(line_chart, use_container_width=True)
 
-    country_counts_dict = country_counts['Country'].to_dict()
-    if 'Democratic Republic Of The Congo' in country_counts_dict:
-        country_counts_dict['Dem. Rep. Congo'] = country_counts_dict['Democratic Republic Of The Congo']
-        country_counts_dict.pop('Democratic Republic Of The Congo')
-    country_counts_dict = sorted(country_counts_dict.items(), key = lambda x: x[1], reverse = True)
-    
-
-    names, values = [], []
-    for country, cases in country_counts_dict:
-        names.append(country)
-        values.append(cases)
+    names, values = charts.country_case_lists(country_counts)
         
     col1, col2 = st.columns(2)
     col3, col4 = st.columns(2)
@@ -145,22 +129,49 @@ if selected == '"Home"' or selected == 'Home':
     with col1:
         st.write('## Cumulative Case Table')
         st.write('#### Select countries to directly compare:')
-        merged = charts.get_daily_increases(cum_df, names, values)
-
-        gb = GridOptionsBuilder.from_dataframe(merged)
+        # Built once per data version; only the current page is sent to the grid
+        table = case_table.get(data_version,
+            lambda: case_table.CaseTable(charts.get_daily_increases(country_timeseries.latest(), country_counts)))
+
+        search_col, sort_col, page_col = st.columns([2, 2, 1])
+        search = search_col.text_input('Search', key = 'case_table_search')
+        sort_by = sort_col.selectbox('Sort by', list(table.frame.columns), index = 1,
+            format_func = str.strip, key = 'case_table_sort')
+        positions = table.query(search, sort_by, sort_by != table.key)
+
+        # The page is seeded in session state only, so the widget never gets two defaults;
+        # a narrower search can leave fewer pages than the one last shown
+        page_count = table.page_count(positions)
+        if st.session_state.setdefault('case_table_page', 1) > page_count:
+            st.session_state['case_table_page'] = page_count
+        page_number = page_col.number_input('Page', min_value = 1, max_value = page_count,
+            key = 'case_table_page')
+        page_df = table.page(positions, page_number)
+
+        # Selection is kept as country names, so it survives paging, sorting and search
+        selected_keys = st.session_state.setdefault('case_table_selected', [])
+        page_keys = list(page_df[table.key])
+
+        gb = GridOptionsBuilder.from_dataframe(page_df)
         gb.configure_side_bar()
-        gb.configure_selection('multiple', use_checkbox=True, groupSelectsChildren="Group checkbox select children") # Enable multi-row selection
+        gb.configure_selection('multiple', use_checkbox=True, groupSelectsChildren="Group checkbox select children",
+            pre_selected_rows = [i for i, key in enumerate(page_keys) if key in selected_keys]) # Enable multi-row selection
         gridOptions = gb.build()
 
+        grid_key = f'case_table_{data_version}_{search}_{sort_by}_{page_number}'
         grid_response = AgGrid(
-            merged, gridOptions=gridOptions,
-            data_return_mode='AS_INPUT', update_mode='MODEL_CHANGED', 
+            page_df, gridOptions=gridOptions,
+            data_return_mode='AS_INPUT', update_mode='SELECTION_CHANGED', 
             fit_columns_on_grid_load=False,
-            theme='alpine', enable_enterprise_modules=True, height=350, width='100%', reload_data=True
+            theme='alpine', enable_enterprise_modules=True, height=350, width='100%', key=grid_key
         )
 
-        selected = grid_response['selected_rows'] 
-        selected_df = pd.DataFrame(selected) # Pass the selected rows to a new dataframe
+        # Until the grid has reported back, its selection is the pre-selection
+        if grid_key in st.session_state:
+            chosen = [row[table.key] for row in grid_response['selected_rows']]
+            selected_keys = case_table.update_selection(selected_keys, page_keys, chosen)
+            st.session_state['case_table_selected'] = selected_keys
+        selected_df = table.rows(selected_keys)
         
     # Direct Comparison Table
     with col2: 
@@ -177,42 +188,59 @@ if selected == '"Home"' or selected == 'Home':
             grid2_response = AgGrid(
                 selected_df,
                 data_return_mode='AS_INPUT', 
-                update_mode='MODEL_CHANGED', theme='alpine', height=300
+                update_mode='NO_UPDATE', theme='alpine', height=300
             )
 
     # Total global cases graph
     with col3: 
         st.write('## Total Cases Globally')
-        global_case_graph = charts.global_case_graph(total_df)
-        fig, ax, ax2 = global_case_graph[0], global_case_graph[1], global_case_graph[2]
-        st.pyplot(fig)
+        case_range = st.radio('Date Range', list(charts.CASE_GRAPH_RANGES), horizontal = True,
+            key = 'case_graph_range')
+        case_graph_slot = st.empty()
 
     # Global cases pie chart
     with col4:
         st.write('## Breakdown of Global Cases')
-        global_pie_chart = charts.global_pie_chart(names, values)
-        fig, ax = global_pie_chart[0], global_pie_chart[1]
-        st.pyplot(fig)
+        pie_chart_slot = st.empty()
 
     # Gender distribution pie chart
     with col5:
         st.write('## Gender Distribution of Cases')
-        gender_chart = charts.gender_chart(full_df)
-        fig, ax = gender_chart[0], gender_chart[1]
-        st.pyplot(fig)
+        gender_chart_slot = st.empty()
     
     # Hospitalization bar chart
     with col6:
         st.write('## Hospitalization Rates')
-        hosp_chart = charts.hospitalization_chart(full_df)
-        fig, ax = hosp_chart[0], hosp_chart[1]
-        st.pyplot(fig)
+        hospitalization_chart_slot = st.empty()
+
+    # The four figures are built together (in parallel with MPX_RENDER_WORKERS), then placed
+    days = charts.CASE_GRAPH_RANGES[case_range]
+    images = render_cache.render_many(data_version, [
+        ('global_case_graph', charts.global_case_graph, (rollups, days), (days,)),
+        ('global_pie_chart', charts.global_pie_chart, (names, values), ()),
+        ('gender_chart', charts.gender_chart, (case_aggregates.gender,), ()),
+        ('hospitalization_chart', charts.hospitalization_chart, (case_aggregates.hospitalised,), ()),
+    ])
+    slots = [case_graph_slot, pie_chart_slot, gender_chart_slot, hospitalization_chart_slot]
+    for slot, image in zip(slots, images):
+        if image is None:
+            slot.warning('This chart could not be drawn. Please try again later.')
+        else:
+            slot.image(image, use_column_width = True)
         
     st.write('Note: Gender and hospitalization data were not reported for all cases, \
         so the true distribution may vary slightly.')
 
 # ---------- Maps Page ---------- #
-if selected == '"Maps"' or selected == 'Maps':
+if page == 'Maps':
+    import maps
+    import render_cache
+
+    # Map rendering: cached images, or vector maps drawn by the browser
+    st.sidebar.header('Map Options')
+    map_mode = st.sidebar.radio('Map Rendering', ['Image', 'Interactive'])
+    if map_mode == 'Interactive':
+        map_zoom = st.sidebar.select_slider('Map Detail', options = [1, 2, 3], value = 2)
 
     # Page Header
     st.write('# Current Monkeypox (MPXV) Cases: ' + curr_total)
@@ -221,20 +249,33 @@ if selected == '"Maps"' or selected == 'Maps':
 
     # World map
     st.write('## Global Data')
-    merged, fig, ax, sm = maps.plot_world(country_counts)
-    merged.plot(column='Cases', cmap='cool', linewidth=0.8, ax=ax, edgecolor='0.7')
-    st.pyplot()
+    world_map_slot = st.empty()
     st.write('')
     st.write('')
 
     # US map
     st.write('## U.S. Data')
-    us_merged, fig, ax, sm = maps.plot_us()
-    us_merged.plot(column='cases', cmap='cool', linewidth=0.8, ax=ax, edgecolor='0.7')
-    st.pyplot()
+    us_map_slot = st.empty()
+
+    if map_mode == 'Interactive':
+        world_map_slot.vega_lite_chart(maps.interactive_world_spec(country_counts, map_zoom),
+            use_container_width = True)
+        us_map_slot.vega_lite_chart(maps.interactive_us_spec(page_data['state_cases'], map_zoom),
+            use_container_width = True)
+    else:
+        # Both maps are built together (in parallel with MPX_RENDER_WORKERS), then placed
+        images = render_cache.render_many(data_version, [
+            ('world_map', maps.world_map_figure, (country_counts,), ()),
+            ('us_map', maps.us_map_figure, (page_data['state_cases'],), ()),
+        ])
+        for slot, image in zip([world_map_slot, us_map_slot], images):
+            if image is None:
+                slot.warning('This map could not be drawn. Please try again later.')
+            else:
+                slot.image(image, use_column_width = True)
 
 # ---------- Resources Page ---------- #
-if selected == '"Resources"' or selected == 'Resources':
+if page == 'Resources':
     st.write('# Important Information about Monkeypox')
     st.write('Information gathered from the CDC: https://www.cdc.gov/poxvirus/monkeypox/')
 
@@ -270,12 +311,14 @@ if selected == '"Resources"' or selected == 'Resources':
     ''', unsafe_allow_html=True)
 
 # ---------- Sources Page ---------- #
-if selected in ('"Sources"', 'Sources'):
+if page == 'Sources':
     st.write('## Sources and Acknowledgments')
     st.write('The visualizations in this dashboard are made possible by public data provided by various sources.')
     st.write('')
     st.write('')
     st.write('Data on Monkeypox cases are provided by Global.health, and can be found at the following repository:')
+    # Read from the recorded date when no data page has loaded the data this session
+    last_updated = st.session_state.get('last_updated') or pages.last_updated()
     st.write(f'https://github.com/globaldothealth/monkeypox (Last accessed: {last_updated})')
     st.write('')
     st.write('Case counts by U.S. state is provided by the CDC:')
@@ -312,6 +355,23 @@ st.sidebar.write('')
 st.sidebar.write('')
 st.sidebar.write('')
 
+# Manual refresh on the data pages (runs as a callback; other sessions keep the old
+# data until it completes)
+if page_data:
+    import data_loader
+
+    st.sidebar.button('Refresh Data', on_click = data_loader.refresh_data)
+    cache_stats = data_loader.cache_stats()
+    st.sidebar.caption(f"Data cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['load_seconds']:.1f}s spent loading")
+
+# Per-rerun timings of the instrumented functions (enable with MPX_DEBUG_PANEL=1)
+if metrics.DEBUG_PANEL:
+    with st.sidebar.expander('Rerun Timings'):
+        st.text('\n'.join(f"{'  ' * span['depth']}{span['name']}: {span['seconds'] * 1000:.1f} ms, "
+            f"{span['memory_mb']:+.1f} MB" for span in metrics.rerun_spans()))
+        st.caption(f'Rerun so far: {metrics.rerun_seconds() * 1000:.0f} ms')
+
 
 
 # [theme]
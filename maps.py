@@ -1,40 +1,43 @@
 # Contains functions to create the global and US maps.
-import geopandas
-import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import countries
+import geometry
+import metrics
+
+# Label placement for crowded states: offset (degrees) from the state's centroid and
+# whether the label sits on the state ('map') or in the side key ('key').
+# Every other state is labeled at its centroid.
+STATE_LABELS = pd.DataFrame([
+    ('Louisiana', 0, -0.5, 'map'),
+    ('Mississippi', 0, -0.75, 'map'),
+    ('West Virginia', 0, -0.75, 'map'),
+    ('Virginia', 0, -0.75, 'map'),
+    ('New York', 0.3, -0.5, 'map'),
+    ('Vermont', 0.3, -0.5, 'map'),
+    ('Connecticut', 0.5, -0.4, 'map'),
+    ('District of Columbia', 10, -2, 'key'),
+    ('Delaware', 8.2, -3, 'key'),
+    ('New Hampshire', 4.5, -4.25, 'key'),
+    ('Massachusetts', 4.5, -3.7, 'key'),
+    ('Rhode Island', 4.4, -3.95, 'key'),
+], columns = ['NAME', 'dx', 'dy', 'placement']).set_index('NAME')
+
+# Separator between the state name and its count, per placement
+LABEL_SEPARATORS = {'map': '\n', 'key': ': '}
+
+@metrics.timed
 def plot_world(country_counts):
     '''Displays a world map colored by case counts for each country'''
 
-    map_df = geopandas.read_file('land_data/country_map/ne_50m_admin_0_countries.shp')
-    map_df = map_df[['NAME', 'geometry']]
+    # Prepared once per process: names fixed and keyed, Antarctica removed, shapes simplified
+    map_df = geometry.load('world')
 
-    # Removing Antarctica from map
-    map_df.drop([map_df.index[239]], inplace = True)
-    
-    # Fixing spelling differences between data sources
-    map_df['NAME'] = np.where(map_df['NAME'] == 'United States of America', 'United States', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Bosnia and Herz.', 'Bosnia And Herzegovina', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Congo', 'Republic of Congo', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Dem. Rep. Congo', 'Democratic Republic Of The Congo', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Dominican Rep.', 'Dominican Republic', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Central African Rep.', 'Central African Republic', map_df['NAME'])
-    map_df['NAME'] = np.where(map_df['NAME'] == 'Czechia', 'Czech Republic', map_df['NAME'])
-
-    base = map_df['NAME'].unique()
-    other = country_counts['Country'].to_dict()
-    
-    # Combining counts for the United Kingdom
-    uk_current = other['England']
-    uk_new = sum([other[country] for country in other if country in ('England', 'Scotland', 'Wales', 'Northern Ireland', 'Cayman Islands')])
-    
-    other = pd.DataFrame(list(other.items()), columns = ['Country', 'Cases'])
-    other.loc[len(other.index)] = ['United Kingdom', uk_new]
+    other = country_case_values(country_counts)
 
-    # Merging the map and data by country name
-    merged = map_df.merge(other, how = 'left', left_on = 'NAME',
-        right_on = 'Country')
+    # Merging the map and data by country key
+    merged = map_df.merge(other[['Country Key', 'Cases']], how = 'left', on = 'Country Key')
     merged['Cases'] = merged['Cases'].fillna(0)
     
     # Change max for colorbar to the current max cases
@@ -52,19 +55,18 @@ def plot_world(country_counts):
     sm.set_array([])
 
     # Displaying colorball legend and map 
-    fig.colorbar(sm, orientation="horizontal", fraction=0.036, pad=0.1, aspect = 40)
+    fig.colorbar(sm, ax = ax, orientation="horizontal", fraction=0.036, pad=0.1, aspect = 40)
 
     return merged, fig, ax, sm
 
 
-def plot_us():
+@metrics.timed
+def plot_us(state_cases: pd.DataFrame):
     '''Displays the US map colored by case counts for each state'''
 
     # Set up data
-    us_map_df = geopandas.read_file('land_data/us_map/cb_2018_us_state_5m.shp')
-    us_map_df = us_map_df[['NAME', 'geometry']]
+    us_map_df = geometry.load('us')
     
-    state_cases = pd.read_csv('https://raw.githubusercontent.com/gridviz/monkeypox/main/data/processed/monkeypox_cases_states_cdc_latest.csv')
     state_cases = state_cases[['state', 'cases']]
 
     # Merge map and case data on state names
@@ -89,45 +91,109 @@ def plot_us():
     ax.set_ylim(ylim)
 
     # Labeling states
-    manual_list = ['Louisiana', 'Mississippi', 'West Virginia', 'Virginia', 'District of Columbia', 'Delaware', 'New York',
-        'New Hampshire', 'Massachusetts', 'Rhode Island', 'Vermont', 'Connecticut']
-    
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = x['geometry'].centroid.coords[0], 
-                ha = 'center', fontsize = 14) if x.NAME not in manual_list else '', axis = 1)
-
-    # Manual label adjustents
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0], x['geometry'].centroid.coords[0][1] - 0.5), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Louisiana' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0], x['geometry'].centroid.coords[0][1] - 0.75), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Mississippi' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0], x['geometry'].centroid.coords[0][1] - 0.75), 
-        ha = 'center', fontsize = 14) if x.NAME == 'West Virginia' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0], x['geometry'].centroid.coords[0][1] - 0.75), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Virginia' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 0.3, x['geometry'].centroid.coords[0][1] - 0.5), 
-        ha = 'center', fontsize = 14) if x.NAME == 'New York' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 0.3, x['geometry'].centroid.coords[0][1] - 0.5), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Vermont' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 0.5, x['geometry'].centroid.coords[0][1] - 0.4), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Connecticut' else '', axis = 1)
-    
-    # Side key
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + ': ' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 10, x['geometry'].centroid.coords[0][1] - 2), 
-        ha = 'center', fontsize = 14) if x.NAME == 'District of Columbia' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + ': ' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 8.2, x['geometry'].centroid.coords[0][1] - 3), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Delaware' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + ': ' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 4.5, x['geometry'].centroid.coords[0][1] - 4.25), 
-        ha = 'center', fontsize = 14) if x.NAME == 'New Hampshire' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + ': ' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 4.5, x['geometry'].centroid.coords[0][1] - 3.7), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Massachusetts' else '', axis = 1)
-    us_merged.apply(lambda x: ax.annotate(text = x.NAME + ': ' + str(int(x.cases)), xy = (x['geometry'].centroid.coords[0][0] + 4.4, x['geometry'].centroid.coords[0][1] - 3.95), 
-        ha = 'center', fontsize = 14) if x.NAME == 'Rhode Island' else '', axis = 1)   
+    label_states(ax, us_merged)
 
     # Colorbar legend
     sm = plt.cm.ScalarMappable(cmap='cool', norm=plt.Normalize(vmin=min, vmax=max))
     sm.set_array([])
 
     # Displaying colorbar legend and map 
-    fig.colorbar(sm, orientation="horizontal", fraction=0.036, pad=0.1, aspect = 40)
+    fig.colorbar(sm, ax = ax, orientation="horizontal", fraction=0.036, pad=0.1, aspect = 40)
+
+    return us_merged, fig, ax, sm
+
+def world_map_figure(country_counts):
+    '''Returns the finished world map figure'''
+
+    merged, fig, ax, sm = plot_world(country_counts)
+    merged.plot(column='Cases', cmap='cool', linewidth=0.8, ax=ax, edgecolor='0.7')
+    return fig
+
+
+def us_map_figure(state_cases: pd.DataFrame):
+    '''Returns the finished US map figure'''
+
+    us_merged, fig, ax, sm = plot_us(state_cases)
+    us_merged.plot(column='cases', cmap='cool', linewidth=0.8, ax=ax, edgecolor='0.7')
+    return fig
+
+
+@metrics.timed
+def label_states(ax, us_merged):
+    '''Annotates every state with its case count, using the STATE_LABELS placements'''
+
+    # Positions and texts for all states in one vectorized pass
+    placement = STATE_LABELS.reindex(us_merged['NAME'].values)
+    x = us_merged['centroid_x'].values + placement['dx'].fillna(0).values
+    y = us_merged['centroid_y'].values + placement['dy'].fillna(0).values
+    separators = placement['placement'].fillna('map').map(LABEL_SEPARATORS).values
+    texts = us_merged['NAME'].values + separators + us_merged['cases'].astype(int).astype(str).values
+
+    for text, x_pos, y_pos in zip(texts, x, y):
+        ax.annotate(text = text, xy = (x_pos, y_pos), ha = 'center', fontsize = 14)
+
+
+# ------- Interactive Vector Maps ------- #
+def interactive_world_spec(country_counts, zoom: int = 2):
+    '''Returns a Vega-Lite spec drawing the world map client-side'''
+
+    values = country_case_values(country_counts)[['Country', 'Cases']].rename(columns = {'Country': 'NAME'})
+    return interactive_map_spec('world', values, 'Total Monkeypox Cases per Country', 'equirectangular', zoom)
+
+
+def interactive_us_spec(state_cases: pd.DataFrame, zoom: int = 2):
+    '''Returns a Vega-Lite spec drawing the US map client-side'''
+
+    values = state_cases[['state', 'cases']].rename(columns = {'state': 'NAME', 'cases': 'Cases'})
+    return interactive_map_spec('us', values, 'Total Monkeypox Cases per State', 'albersUsa', zoom)
+
+
+@metrics.timed
+def interactive_map_spec(name: str, values: pd.DataFrame, title: str, projection: str, zoom: int):
+    '''Returns a Vega-Lite choropleth joining per-region values onto pre-simplified geometry.
+
+    values are joined on their NAME column, matched to the geometry's region names.
+
+    The browser draws the shapes, so the server does no rendering. The geometry is
+    referenced by URL (see geometry.geojson_url), so the browser fetches it once per
+    zoom level and each rerun only sends the values. Data is kept inside the layer so
+    Streamlit passes it through as JSON.
+    '''
+
+    values = values.dropna()
+    return {
+        'title': title,
+        'height': 500,
+        'projection': {'type': projection},
+        'layer': [{
+            'data': {'url': geometry.geojson_url(name, zoom), 'format': {'type': 'json', 'property': 'features'}},
+            'transform': [
+                {'lookup': 'properties.NAME',
+                    'from': {'data': {'values': values.to_dict('records')}, 'key': 'NAME', 'fields': ['Cases']}},
+                {'calculate': 'datum.Cases || 0', 'as': 'Cases'},
+            ],
+            'mark': {'type': 'geoshape', 'stroke': '#b3b3b3', 'strokeWidth': 0.5},
+            'encoding': {
+                'color': {'field': 'Cases', 'type': 'quantitative', 'scale': {'range': ['#00ffff', '#ff00ff']},
+                    'legend': {'orient': 'bottom', 'gradientLength': 400}},
+                'tooltip': [{'field': 'properties.NAME', 'type': 'nominal', 'title': 'Region'},
+                    {'field': 'Cases', 'type': 'quantitative'}],
+            },
+        }],
+    }
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def country_case_values(country_counts):
+    '''Returns (Country Key, Country, Cases) rows for the world map, with the UK's nations combined.
+
+    country_counts is indexed by Country Key (see aggregates.CaseAggregates.country).
+    '''
+
+    # Counts are summed onto the country each one is drawn as (see countries.MAP_COUNTRIES)
+    map_keys = countries.map_keys(country_counts.index.values)
+    cases = pd.Series(country_counts.values).groupby(map_keys).sum()
+    cases = cases[cases.index != countries.UNKNOWN]
 
-    return us_merged, fig, ax, sm
\ No newline at end of file
+    return pd.DataFrame({'Country Key': cases.index, 'Country': countries.names(cases.index.values),
+        'Cases': cases.values})
@@ -0,0 +1,181 @@
+# This module times the dashboard's hot paths.
+#
+# Functions wrapped with @timed (or blocks wrapped in `with span(...)`) record their
+# wall time and resident memory change. Each Streamlit rerun runs on its own thread,
+# so spans are collected per rerun for the debug panel, and every span is also folded
+# into process-wide totals that can be scraped in the Prometheus text format from
+# http://$MPX_METRICS_HOST:$MPX_METRICS_PORT/metrics. The endpoint listens on the
+# loopback interface only unless MPX_METRICS_HOST names another address.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port of the Prometheus endpoint; unset leaves it off
+METRICS_PORT = os.environ.get('MPX_METRICS_PORT')
+
+# Address the Prometheus endpoint listens on; 0.0.0.0 exposes it on every interface
+METRICS_HOST = os.environ.get('MPX_METRICS_HOST', '127.0.0.1')
+
+# Shows the per-rerun timing panel in the sidebar
+DEBUG_PANEL = os.environ.get('MPX_DEBUG_PANEL') == '1'
+
+# Upper bounds (seconds) of the span duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = dict()
+_server = None
+
+
+@contextmanager
+def span(name: str):
+    '''Records the wall time and resident memory change of the enclosed block'''
+
+    stack = _stack()
+    record = {'name': name, 'depth': len(stack), 'seconds': 0.0, 'memory_mb': 0.0}
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans.append(record)
+
+    stack.append(name)
+    start, start_rss = time.perf_counter(), _rss()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['memory_mb'] = (_rss() - start_rss) / 1e6
+        stack.pop()
+        _add_total(name, record['seconds'])
+
+
+def timed(func):
+    '''Decorator recording a span named after the function on every call.
+
+    The cache_clear and cache_info of an lru_cache'd function stay reachable on the wrapper.
+    '''
+
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+
+    for attribute in ('cache_clear', 'cache_info'):
+        if hasattr(func, attribute):
+            setattr(wrapper, attribute, getattr(func, attribute))
+
+    return wrapper
+
+
+def start_rerun():
+    '''Starts collecting the spans of the current thread's script rerun'''
+
+    _local.spans = []
+    _local.stack = []
+    _local.started = time.perf_counter()
+
+
+def rerun_spans() -> list[dict]:
+    '''Returns the spans recorded so far in the current rerun, in start order'''
+
+    return list(getattr(_local, 'spans', []))
+
+
+def rerun_seconds() -> float:
+    '''Returns the time since the current rerun started'''
+
+    return time.perf_counter() - getattr(_local, 'started', time.perf_counter())
+
+
+def totals() -> dict:
+    '''Returns {span name: {'count', 'seconds', 'max_seconds', 'buckets'}} for the process'''
+
+    with _lock:
+        return {name: dict(total, buckets = list(total['buckets'])) for name, total in _totals.items()}
+
+
+def prometheus_text(extra: dict = None) -> str:
+    '''Returns the process totals in the Prometheus text exposition format.
+
+    extra maps further gauge names to values, e.g. cache counters.
+    '''
+
+    lines = ['# HELP mpx_span_seconds Wall time of instrumented dashboard functions.',
+        '# TYPE mpx_span_seconds histogram']
+    for name, total in sorted(totals().items()):
+        label = f'span="{name}"'
+        for bound, count in zip(BUCKETS, total['buckets']):
+            lines.append(f'mpx_span_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'mpx_span_seconds_bucket{{{label},le="+Inf"}} {total["count"]}')
+        lines.append(f'mpx_span_seconds_sum{{{label}}} {total["seconds"]:.6f}')
+        lines.append(f'mpx_span_seconds_count{{{label}}} {total["count"]}')
+
+    for name, value in sorted((extra or dict()).items()):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port: int, extra = None, host: str = METRICS_HOST):
+    '''Starts the /metrics endpoint on a background thread, once per process.
+
+    extra is called on every scrape and returns further gauges (see prometheus_text).
+    '''
+
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = prometheus_text(extra() if extra else None).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        threading.Thread(target = _server.serve_forever, daemon = True).start()
+        return _server
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _add_total(name, seconds):
+    with _lock:
+        total = _totals.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+            'buckets': [0] * len(BUCKETS)})
+        total['count'] += 1
+        total['seconds'] += seconds
+        total['max_seconds'] = max(total['max_seconds'], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                total['buckets'][i] += 1
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _rss():
+    # Resident set size in bytes; Linux only, elsewhere memory deltas read as zero
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
@@ -0,0 +1,92 @@
+# This module declares what each dashboard page needs, so a page only imports the
+# modules and loads the datasets it actually uses.
+#
+# The Resources and Sources pages declare nothing, so they render without importing
+# data_loader (and with it pandas, pyarrow and requests), the chart and map libraries
+# or loading any data.
+
+import importlib
+from datetime import date
+
+# data_loader function loading every dataset a page can declare
+DATASETS = {
+    'summary': 'load_summary',
+    'state_cases': 'load_state_cases',
+    'country_timeseries': 'load_country_timeseries',
+    'rollups': 'load_rollups',
+    'aggregates': 'load_aggregates',
+    'data_version': 'data_version',
+}
+
+# Date format of the last updated date shown on the pages
+DATE_FORMAT = '%b %d, %Y'
+
+# Modules imported and datasets loaded by each page
+PAGES = {
+    'Home': {
+        'modules': ['case_table', 'charts', 'render_cache', 'st_aggrid'],
+        'datasets': ['summary', 'country_timeseries', 'rollups', 'aggregates', 'data_version'],
+    },
+    'Maps': {
+        'modules': ['maps', 'render_cache'],
+        'datasets': ['summary', 'state_cases', 'aggregates', 'data_version'],
+    },
+    'Resources': {'modules': [], 'datasets': []},
+    'Sources': {'modules': [], 'datasets': []},
+}
+
+
+def page_name(selected: str) -> str:
+    '''Returns the page name of a navigation bar selection'''
+
+    # The navigation bar can report its selection wrapped in quotes
+    return selected.strip('"')
+
+
+def load(page: str) -> dict:
+    '''Imports the modules a page uses and returns its datasets, {name: data}'''
+
+    spec = PAGES[page]
+    for module in spec['modules']:
+        importlib.import_module(module)
+
+    if not spec['datasets']:
+        return dict()
+
+    import data_loader
+
+    # Picks up data the shared data service reloaded since the last rerun
+    data_loader.sync()
+
+    # Downloads every source without a snapshot concurrently (cached per process)
+    data_loader.prefetch()
+
+    # A background refresh swapping the data in mid-load would mix old and new
+    # datasets; load again until they all come from the same generation
+    while True:
+        generation = data_loader.generation()
+        page_data = {name: getattr(data_loader, DATASETS[name])() for name in spec['datasets']}
+        if data_loader.generation() == generation:
+            return page_data
+
+
+def modules() -> list[str]:
+    '''Returns every module imported by some page, in declaration order'''
+
+    return list(dict.fromkeys(module for spec in PAGES.values() for module in spec['modules']))
+
+
+def last_updated() -> str:
+    '''Returns the last date with case data as shown on the pages.
+
+    Read from the date the loaders record (see snapshots.read_last_date), so it costs
+    no data loading; only before anything has recorded it is the summary loaded.
+    '''
+
+    import snapshots
+
+    last_date = snapshots.read_last_date()
+    if not last_date:
+        import data_loader
+        return data_loader.load_summary()['last_updated'].strftime(DATE_FORMAT)
+    return date.fromisoformat(last_date).strftime(DATE_FORMAT)
@@ -0,0 +1,86 @@
+# This module refreshes the data in the background, off the request path.
+#
+# A daemon thread calls data_loader.rebuild() every MPX_REFRESH_INTERVAL seconds
+# (randomized by MPX_REFRESH_JITTER, so several processes do not hit upstream in
+# step). rebuild() loads into a staged cache and swaps it in whole, so sessions keep
+# reading the previous data until the new data is complete. Failed refreshes are
+# retried with exponential backoff, starting at MPX_REFRESH_BACKOFF seconds and
+# capped at the interval; the previous data stays live meanwhile.
+
+import logging
+import os
+import random
+import threading
+import time
+
+import data_service
+
+# Seconds between refreshes; 0 turns the background refresher off
+INTERVAL = float(os.environ.get('MPX_REFRESH_INTERVAL', 60 * 60))
+
+# Fraction of the interval each wait is randomly lengthened or shortened by
+JITTER = float(os.environ.get('MPX_REFRESH_JITTER', 0.1))
+
+# Seconds before the first retry of a failed refresh, doubled on each further failure
+BACKOFF = float(os.environ.get('MPX_REFRESH_BACKOFF', 60))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_thread = None
+_status = {'last_success': None, 'last_error': None, 'failures': 0, 'next_run': None}
+
+
+def start(interval: float = INTERVAL):
+    '''Starts the background refresher once per process, unless it is turned off.
+
+    Workers backed by the data service leave refreshing to the service.
+    '''
+
+    global _thread
+    if interval <= 0 or (data_service.ADDRESS and not data_service.serving):
+        return
+
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target = _run, args = (interval,), name = 'data-refresher', daemon = True)
+            _thread.start()
+
+
+def next_delay(interval: float, failures: int) -> float:
+    '''Returns the seconds to wait before the next refresh'''
+
+    if failures:
+        return min(BACKOFF * 2 ** (failures - 1), interval)
+    return interval * (1 + random.uniform(-JITTER, JITTER))
+
+
+def status() -> dict:
+    '''Returns the time of the last successful refresh, the last error and the failure count'''
+
+    with _lock:
+        return dict(_status)
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _run(interval):
+    # Imported here, off the request path, so starting the refresher stays cheap
+    import data_loader
+
+    while True:
+        delay = next_delay(interval, _status['failures'])
+        with _lock:
+            _status['next_run'] = time.time() + delay
+        time.sleep(delay)
+
+        try:
+            data_loader.rebuild()
+        except Exception as error:
+            logger.exception('Background data refresh failed')
+            with _lock:
+                _status['failures'] += 1
+                _status['last_error'] = repr(error)
+        else:
+            with _lock:
+                _status['failures'] = 0
+                _status['last_success'] = time.time()
@@ -0,0 +1,161 @@
+# This module caches rendered chart images so unchanged charts skip matplotlib.
+#
+# Images are keyed by chart name, data version and chart parameters, and evicted
+# least-recently-used first once their total size passes the memory cap. render_many
+# builds a page's missing images together, in render workers when they are enabled
+# and otherwise in-process under render_lock (see render_pool.py).
+
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import matplotlib.pyplot as plt
+
+import metrics
+
+# Upper bound on the total size of cached images
+MAX_BYTES = int(os.environ.get('MPX_RENDER_CACHE_MB', 64)) * 1024 * 1024
+
+# Matches the defaults st.pyplot uses, so cached images look the same
+SAVEFIG_OPTIONS = {'dpi': 200, 'bbox_inches': 'tight'}
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    '''Thread-safe LRU cache of rendered images with a memory cap'''
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                return None
+            self._images.move_to_end(key)
+            self._stats['hits'] += 1
+            return image
+
+    def put(self, key, image: bytes):
+        with self._lock:
+            self._stats['misses'] += 1
+            if len(image) > self.max_bytes:
+                return
+            if key in self._images:
+                self._size -= len(self._images.pop(key))
+            self._images[key] = image
+            self._size += len(image)
+            while self._size > self.max_bytes:
+                _, evicted = self._images.popitem(last = False)
+                self._size -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries = len(self._images), bytes = self._size)
+
+
+_cache = RenderCache()
+
+# pyplot keeps global state, so figures rendered in-process are built one at a time
+# across sessions (see render_pool.render_in_process)
+render_lock = threading.Lock()
+
+# Futures of the images being rendered by render_many, by cache key
+_pending = dict()
+_pending_lock = threading.Lock()
+
+
+@metrics.timed
+def render_many(data_version: str, figures: list, format: str = 'png') -> list:
+    '''Returns the image bytes of several charts, rendering the cache misses in parallel.
+
+    Each figure is (name, build, args, params): build(*args) is called on a cache
+    miss, in a render worker when MPX_RENDER_WORKERS is set (see render_pool.py), so
+    build must be a module-level function. params must be hashable and, with the
+    name and data version, identify the image in the cache. A figure that fails to
+    render is logged and returned as None, so the rest of the page still shows.
+    '''
+
+    import render_pool
+
+    keys = [(name, data_version, params, format) for name, _, _, params in figures]
+    images, futures, owned = dict(), dict(), dict()
+    for key, figure in zip(keys, figures):
+        if key in images or key in futures:
+            continue
+        image = _cache.get(key)
+        if image is not None:
+            images[key] = image
+            continue
+
+        # Claimed with a placeholder, so another session asking for the same image
+        # waits on it rather than rendering it again
+        with _pending_lock:
+            future = _pending.get(key)
+            if future is None:
+                future = _pending[key] = Future()
+                owned[key] = figure
+        futures[key] = future
+
+    # Claimed figures are all started before any is waited on, so they render together
+    started = {key: render_pool.submit(build, args, format) for key, (_, build, args, _) in owned.items()}
+
+    # Own figures are finished first: a session never waits on another while holding claims
+    for key, (name, build, args, params) in owned.items():
+        try:
+            image = render_pool.result(started[key], build, args, format)
+        except Exception as error:
+            logger.exception('Cannot render %s', name)
+            futures[key].set_exception(error)
+        else:
+            _cache.put(key, image)
+            futures[key].set_result(image)
+        finally:
+            with _pending_lock:
+                _pending.pop(key, None)
+
+    for key, (name, _, _, _) in zip(keys, figures):
+        if key in images:
+            continue
+        try:
+            images[key] = futures[key].result()
+        except Exception:
+            if key not in owned:
+                logger.warning('%s failed to render in another session', name)
+            images[key] = None
+
+    return [images[key] for key in keys]
+
+
+@metrics.timed
+def figure_bytes(fig, format: str = 'png') -> bytes:
+    '''Renders a figure to image bytes and closes it'''
+
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format = format, **SAVEFIG_OPTIONS)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def clear():
+    _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,172 @@
+# This module renders figures in a pool of worker processes, so the figures of a page
+# are built in parallel instead of one after another in the script thread.
+#
+# MPX_RENDER_WORKERS sets the number of worker processes; 0 (the default) renders
+# in-process, one figure at a time. Workers use the Agg backend and stay up for the
+# life of the process, so each loads the chart libraries and map geometry once.
+# Figure inputs are pickled; arrays past SHARED_MEMORY_BYTES travel through shared
+# memory instead of the worker pipe. A pool that fails falls back to in-process
+# rendering.
+
+import importlib
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+import metrics
+import render_cache
+
+# Worker processes rendering figures; 0 renders in-process
+WORKERS = int(os.environ.get('MPX_RENDER_WORKERS', 0))
+
+# Total array size of a figure's inputs past which they are sent through shared memory
+SHARED_MEMORY_BYTES = 1024 * 1024
+
+# Modules each worker imports as it starts, so the first figures do not wait on them
+PRELOAD = ['charts', 'maps']
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+
+def submit(build, args: tuple = (), format: str = 'png') -> Future:
+    '''Starts rendering build(*args) and returns a future of the image bytes.
+
+    build must be a module-level function (so it can be sent to a worker) returning
+    a matplotlib figure, or a tuple whose first item is one.
+    '''
+
+    executor = _get_executor()
+    if executor is not None:
+        try:
+            payload, shared = _pack(args)
+        except (pickle.PicklingError, TypeError, AttributeError, OSError) as error:
+            logger.warning('Inputs of %s cannot be sent to a render worker (%s); rendering in-process',
+                build.__name__, error)
+        else:
+            try:
+                future = executor.submit(_render, build, payload, format)
+            except (BrokenProcessPool, RuntimeError) as error:
+                _discard(executor, error)
+                _release(shared)
+            else:
+                future.add_done_callback(lambda _: _release(shared))
+                return future
+
+    future = Future()
+    try:
+        future.set_result(render_in_process(build, args, format))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def result(future: Future, build, args: tuple = (), format: str = 'png') -> bytes:
+    '''Returns the image bytes of a submitted figure, rendering in-process if its worker died'''
+
+    try:
+        return future.result()
+    except BrokenProcessPool as error:
+        _discard(_executor, error)
+        return render_in_process(build, args, format)
+
+
+@metrics.timed
+def render_in_process(build, args: tuple = (), format: str = 'png') -> bytes:
+    '''Renders build(*args) in this process, one figure at a time across sessions'''
+
+    with render_cache.render_lock:
+        return _figure_bytes(build(*args), format)
+
+
+def shutdown():
+    '''Stops the worker processes; the next figure starts a new pool'''
+
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait = True, cancel_futures = True)
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _get_executor():
+    global _executor
+    if WORKERS <= 0:
+        return None
+
+    with _lock:
+        if _executor is None:
+            try:
+                # Spawned rather than forked: the parent runs threads (sessions, refresher)
+                _executor = ProcessPoolExecutor(max_workers = WORKERS, mp_context = get_context('spawn'),
+                    initializer = _init_worker)
+            except OSError as error:
+                logger.warning('Cannot start render workers (%s); rendering in-process', error)
+                return None
+        return _executor
+
+def _discard(executor, error):
+    global _executor
+    logger.warning('Render workers failed (%s); rendering in-process until they restart', error)
+    with _lock:
+        if _executor is executor:
+            _executor = None
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    for module in PRELOAD:
+        importlib.import_module(module)
+
+def _render(build, payload, format):
+    return _figure_bytes(build(*_unpack(payload)), format)
+
+def _figure_bytes(fig, format):
+    if isinstance(fig, tuple):
+        fig = fig[0]
+    return render_cache.figure_bytes(fig, format)
+
+def _pack(args):
+    # Arrays are collected out of band; small ones are sent down the pipe beside the pickle
+    buffers = []
+    data = pickle.dumps(args, protocol = 5, buffer_callback = buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+    size = sum(view.nbytes for view in views)
+    if size < SHARED_MEMORY_BYTES:
+        return ('inline', data, [bytearray(view) for view in views]), None
+
+    shared = shared_memory.SharedMemory(create = True, size = size)
+    offset = 0
+    for view in views:
+        shared.buf[offset:offset + view.nbytes] = view
+        offset += view.nbytes
+    return ('shared', data, shared.name, [view.nbytes for view in views]), shared
+
+def _unpack(payload):
+    if payload[0] == 'inline':
+        _, data, buffers = payload
+        return pickle.loads(data, buffers = buffers)
+
+    _, data, name, sizes = payload
+    shared = shared_memory.SharedMemory(name = name)
+    try:
+        # Copied out so the block can be closed while the figure still holds the arrays
+        buffers, offset = [], 0
+        for size in sizes:
+            buffers.append(bytearray(shared.buf[offset:offset + size]))
+            offset += size
+        return pickle.loads(data, buffers = buffers)
+    finally:
+        shared.close()
+
+def _release(shared):
+    if shared is not None:
+        shared.close()
+        shared.unlink()
@@ -0,0 +1,126 @@
+# This module rolls the case timeseries up to daily, weekly and monthly resolution.
+#
+# Rollups are built once per data load. Charts ask for a date range and get the
+# finest resolution that fits their point budget, so drawing cost depends on the
+# points shown rather than on how long the history is.
+
+import threading
+
+import pandas as pd
+
+# Resample rule, rolling average window (in periods) and period frequency of each
+# resolution; the period frequency gives the span each resampled row counts
+RESOLUTIONS = {
+    'daily': ('D', 7, 'D'),
+    'weekly': ('W-SUN', 4, 'W-SUN'),
+    'monthly': ('MS', 3, 'M'),
+}
+
+# Most points a chart draws before switching to a coarser resolution
+MAX_POINTS = 200
+
+# Share of the latest cumulative total below which the early outbreak is trimmed
+ACTIVE_SHARE = 0.01
+
+
+class Rollups:
+    '''Global and per-country case counts at every resolution.
+
+    Each rollup has Date, Cases (new cases in the period), Cumulative Cases (at the
+    end of the period), Average (rolling mean of Cases), Start and End (the bounds of
+    the period, End exclusive) columns. Date is the resample label: the day, the
+    Sunday ending the week or the first of the month.
+    '''
+
+    def __init__(self, total_df: pd.DataFrame, country_timeseries = None):
+        total = total_df.set_index('Date').sort_index()[['Cases', 'Cumulative Cases']]
+        self._global = {name: _roll_up(total, *settings) for name, settings in RESOLUTIONS.items()}
+
+        # Countries are rolled up from the timeseries store when first asked for, by
+        # whichever session asks first
+        self._country_timeseries = country_timeseries
+        self._countries = dict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Only the global rollups are pickled, for data service and render workers;
+        # an unpickled copy rolls countries up from its process's timeseries store
+        return {'_global': self._global}
+
+    def __setstate__(self, state):
+        self._global = state['_global']
+        self._country_timeseries = None
+        self._countries = dict()
+        self._lock = threading.Lock()
+
+    def active_start(self) -> pd.Timestamp:
+        '''Returns the first date the outbreak had reached ACTIVE_SHARE of its total'''
+
+        daily = self._global['daily']
+        reached = daily['Cumulative Cases'] >= ACTIVE_SHARE * daily['Cumulative Cases'].iloc[-1]
+        return daily.loc[reached.idxmax(), 'Date']
+
+    def end_date(self) -> pd.Timestamp:
+        '''Returns the last date with data'''
+        return self._global['daily']['Date'].iloc[-1]
+
+    def resolution(self, start = None, end = None, max_points: int = MAX_POINTS) -> str:
+        '''Returns the finest resolution with at most max_points periods between start and end'''
+
+        for name in RESOLUTIONS:
+            if len(_between(self._global[name], start, end)) <= max_points:
+                return name
+        return name
+
+    def global_cases(self, start = None, end = None, max_points: int = MAX_POINTS) -> tuple:
+        '''Returns (resolution, rollup) of global cases between start and end'''
+
+        name = self.resolution(start, end, max_points)
+        return name, _between(self._global[name], start, end)
+
+    def country_cases(self, countries: list[str], resolution: str, start = None, end = None) -> pd.DataFrame:
+        '''Returns the rollups of the given countries at a resolution, with a Country column'''
+
+        rollups = []
+        for country in countries:
+            key = (country, resolution)
+            with self._lock:
+                rollup = self._countries.get(key)
+            if rollup is None:
+                df = self._timeseries().select([country]).set_index('Date').sort_index()
+                rollup = _roll_up(df[['Cases', 'Cumulative Cases']], *RESOLUTIONS[resolution])
+                with self._lock:
+                    rollup = self._countries.setdefault(key, rollup)
+            rollups.append(rollup.assign(Country = country))
+
+        if not rollups:
+            return pd.DataFrame(columns = ['Date', 'Cases', 'Cumulative Cases', 'Average', 'Start', 'End', 'Country'])
+        return _between(pd.concat(rollups, ignore_index = True), start, end)
+
+
+    def _timeseries(self):
+        if self._country_timeseries is None:
+            import data_loader
+            self._country_timeseries = data_loader.load_country_timeseries()
+        return self._country_timeseries
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _roll_up(df, rule, window, period):
+    resampled = df.resample(rule)
+    rollup = pd.DataFrame({
+        'Cases': resampled['Cases'].sum(),
+        'Cumulative Cases': resampled['Cumulative Cases'].max().ffill(),
+    })
+    rollup['Average'] = rollup['Cases'].rolling(window, min_periods = 1).mean()
+    periods = rollup.index.to_period(period)
+    rollup['Start'] = periods.start_time
+    rollup['End'] = (periods + 1).start_time
+    return rollup.rename_axis('Date').reset_index()
+
+def _between(rollup, start, end):
+    if start is not None:
+        rollup = rollup[rollup['Date'] >= pd.Timestamp(start)]
+    if end is not None:
+        rollup = rollup[rollup['Date'] <= pd.Timestamp(end)]
+    return rollup
@@ -0,0 +1,101 @@
+# This module stores typed, column-pruned copies of the upstream datasets on disk.
+#
+# Snapshots are written once as uncompressed Arrow (Feather v2) files so later
+# loads memory-map them instead of downloading and re-parsing the CSVs. The loaders
+# also record the last date with case data here, with or without snapshots. pandas and
+# pyarrow are imported on the first read or write, so reading a snapshot's metadata
+# or the last date stays cheap. Build them with:  python snapshots.py
+
+import json
+import os
+
+SNAPSHOT_DIR = os.environ.get('MPX_SNAPSHOT_DIR', 'data_cache/snapshots')
+
+
+def path(name: str) -> str:
+    '''Returns the file path of the named snapshot'''
+
+    return os.path.join(SNAPSHOT_DIR, f'{name}.arrow')
+
+
+def last_date_path() -> str:
+    '''Returns the file path of the recorded last date with case data'''
+
+    return os.path.join(SNAPSHOT_DIR, 'last_date.json')
+
+
+def exists(name: str) -> bool:
+    '''Returns whether the named snapshot has been built'''
+
+    return os.path.exists(path(name))
+
+
+def write(name: str, df: 'pandas.DataFrame'):
+    '''Writes a dataframe to the named snapshot, replacing any previous version'''
+
+    import pyarrow.feather as feather
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok = True)
+
+    # Write to a temporary file first so readers never see a partial snapshot
+    tmp_path = path(name) + '.tmp'
+    feather.write_feather(df.reset_index(drop = True), tmp_path, compression = 'uncompressed')
+    os.replace(tmp_path, path(name))
+
+
+def read(name: str) -> 'pandas.DataFrame':
+    '''Reads the named snapshot through a memory map'''
+
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path(name), memory_map = True)
+    return table.to_pandas()
+
+
+def read_meta(name: str) -> dict:
+    '''Returns the fetch metadata stored next to the named snapshot, if any'''
+
+    meta_path = path(name) + '.json'
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def write_meta(name: str, meta: dict):
+    '''Stores fetch metadata (validators, byte length) next to the named snapshot'''
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok = True)
+    with open(path(name) + '.json', 'w') as f:
+        json.dump(meta, f)
+
+
+
+def read_last_date() -> str:
+    '''Returns the last date with case data (YYYY-MM-DD) recorded by the loaders, if any'''
+
+    if not os.path.exists(last_date_path()):
+        return None
+    with open(last_date_path()) as f:
+        return json.load(f).get('last_date')
+
+
+def write_last_date(last_date: str):
+    '''Records the last date with case data (YYYY-MM-DD) whenever it changes'''
+
+    if read_last_date() == last_date:
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok = True)
+
+    # Every dashboard process can record it, so each writes its own temporary file
+    tmp_path = f'{last_date_path()}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_date': last_date}, f)
+    os.replace(tmp_path, last_date_path())
+
+
+if __name__ == '__main__':
+    import data_loader
+
+    for name in data_loader.build_snapshots():
+        print(f'Wrote {path(name)}')
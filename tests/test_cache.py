@@ -0,0 +1,113 @@
+# Tests that a staged rebuild swaps every dataset in at once, for readers of the cache
+# and for pages.load.
+#
+# Run from the repository root with:  python -m pytest tests
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import data_loader
+import pages
+from cache import DataCache
+
+# Seconds a test waits on another thread before failing
+TIMEOUT = 10
+
+
+@pytest.fixture
+def datasets(monkeypatch):
+    '''Two cached datasets that return the data version current when they load'''
+
+    cache = DataCache()
+    state = {'version': 'old'}
+    loaders = {name: cache.cached(dataset_loader(name, state)) for name in ('cases', 'counts')}
+
+    # Stand in for data_loader's datasets on a page declaring only these two
+    monkeypatch.setattr(data_loader, '_cache', cache)
+    monkeypatch.setattr(data_loader, 'sync', lambda: None)
+    monkeypatch.setattr(data_loader, 'prefetch', lambda: dict())
+    for name, loader in loaders.items():
+        monkeypatch.setattr(data_loader, f'load_{name}', loader, raising = False)
+    monkeypatch.setattr(pages, 'DATASETS', {name: f'load_{name}' for name in loaders})
+    monkeypatch.setattr(pages, 'PAGES', {'Test': {'modules': [], 'datasets': list(loaders)}})
+
+    # The old data is cached before any rebuild
+    for loader in loaders.values():
+        loader()
+    return cache, state, loaders
+
+
+def test_readers_see_old_data_until_the_swap(datasets):
+    cache, state, loaders = datasets
+    halfway, resume = threading.Event(), threading.Event()
+
+    def rebuild():
+        with cache.staging():
+            state['version'] = 'new'
+            loaders['cases']()
+            halfway.set()
+            resume.wait(TIMEOUT)
+            loaders['counts']()
+
+    thread = threading.Thread(target = rebuild)
+    thread.start()
+    assert halfway.wait(TIMEOUT)
+
+    # Half the datasets are staged, but none is visible to other threads yet
+    assert [loader() for loader in loaders.values()] == [('cases', 'old'), ('counts', 'old')]
+
+    resume.set()
+    thread.join(TIMEOUT)
+    assert [loader() for loader in loaders.values()] == [('cases', 'new'), ('counts', 'new')]
+    assert cache.generation == 1
+
+
+def test_staging_failure_keeps_old_data(datasets):
+    cache, state, loaders = datasets
+
+    with pytest.raises(RuntimeError):
+        with cache.staging():
+            state['version'] = 'new'
+            loaders['cases']()
+            raise RuntimeError('download failed')
+
+    assert [loader() for loader in loaders.values()] == [('cases', 'old'), ('counts', 'old')]
+    assert cache.generation == 0
+
+
+def test_page_never_mixes_generations(datasets, monkeypatch):
+    cache, state, loaders = datasets
+    load_cases = loaders['cases']
+
+    def cases_then_swap():
+        # The page has read the old cases when a rebuild swaps new data in
+        cases = load_cases()
+        if cache.generation == 0:
+            thread = threading.Thread(target = swap, args = (cache, state, loaders))
+            thread.start()
+            thread.join(TIMEOUT)
+        return cases
+
+    monkeypatch.setattr(data_loader, 'load_cases', cases_then_swap)
+
+    # The old cases and new counts were read in one pass, so the page loads again
+    assert pages.load('Test') == {'cases': ('cases', 'new'), 'counts': ('counts', 'new')}
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def dataset_loader(name: str, state: dict):
+    def load():
+        return name, state['version']
+    load.__qualname__ = f'load_{name}'
+    return load
+
+def swap(cache, state, loaders):
+    with cache.staging():
+        state['version'] = 'new'
+        for loader in loaders.values():
+            loader()
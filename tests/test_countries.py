@@ -0,0 +1,112 @@
+# Tests the country key encoding shared by the loaders, charts and maps.
+#
+# Run from the repository root with:  python -m pytest tests
+
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import countries
+from aggregates import CaseAggregates
+from timeseries_store import CountryTimeseries
+
+
+@pytest.fixture(autouse = True)
+def table(monkeypatch):
+    '''Reads the country table relative to the repository root'''
+
+    monkeypatch.chdir(ROOT)
+    return countries.table()
+
+
+def test_encode_aliases(table):
+    names, keys = countries.encode(pd.Series(['United States of America', 'united states', 'Spain', 'SPAIN']))
+
+    # Aliases and other spellings share the key and the canonical name
+    assert keys[0] == keys[1] == key_of('United States')
+    assert keys[2] == keys[3] == key_of('Spain')
+    assert list(names) == ['United States', 'United States', 'Spain', 'Spain']
+
+
+def test_encode_iso3_fallback(table):
+    names, keys = countries.encode(pd.Series(['Kingdom of Spain', 'Spain']), pd.Series(['ESP', 'ESP']))
+
+    # An unlisted spelling is keyed by its iso3 code, and keeps its spelling
+    assert keys[0] == keys[1] == key_of('Spain')
+    assert list(names) == ['Kingdom of Spain', 'Spain']
+
+
+def test_encode_blank_names(table):
+    names, keys = countries.encode(pd.Series([np.nan, '', 'Spain']), pd.Series([np.nan, '', 'ESP']))
+
+    assert list(keys) == [countries.UNKNOWN, countries.UNKNOWN, key_of('Spain')]
+    assert list(countries.names(keys)) == [countries.UNKNOWN_NAME, countries.UNKNOWN_NAME, 'Spain']
+
+
+def test_encode_unlisted_names(table):
+    names, keys = countries.encode(pd.Series(['Gibraltar', 'Martinique', 'gibraltar', 'Spain']),
+        pd.Series(['GIB', 'MTQ', 'GIB', 'ESP']))
+
+    # Each unlisted country gets a key of its own after the table's, matched case-insensitively
+    assert keys[0] == keys[2] != keys[1]
+    assert min(keys[0], keys[1]) >= len(table)
+    assert list(countries.names(keys[:2])) == ['Gibraltar', 'Martinique']
+
+    # They have no shape of their own, and the linelist reports them under themselves
+    assert list(countries.map_keys(keys)) == [countries.UNKNOWN] * 3 + [key_of('Spain')]
+    assert list(countries.linelist_keys(keys)) == list(keys)
+
+
+def test_map_and_linelist_keys(table):
+    england, uk = key_of('England'), key_of('United Kingdom')
+
+    assert list(countries.map_keys(np.array([england, uk, countries.UNKNOWN]))) == [uk, uk, countries.UNKNOWN]
+    assert list(countries.linelist_keys(np.array([uk, england, countries.UNKNOWN]))) == [
+        england, england, countries.UNKNOWN]
+
+
+def test_unlisted_keys_survive_another_process(table, monkeypatch):
+    df = timeseries(['Spain', 'Guadeloupe', 'Réunion'])
+    store = CountryTimeseries(df)
+    case_aggregates = CaseAggregates()
+    case_aggregates.add(df)
+    sent = pickle.dumps(store), pickle.dumps(case_aggregates)
+
+    # A process that met the unlisted countries in another order numbers them differently
+    monkeypatch.setattr(countries, '_extra_names', [])
+    monkeypatch.setattr(countries, '_extra_keys', dict())
+    countries.extra_keys(['Martinique', 'Réunion'])
+    store, case_aggregates = map(pickle.loads, sent)
+
+    latest = store.latest()
+    assert store.countries() == ['Spain', 'Guadeloupe', 'Réunion']
+    assert dict(zip(countries.names(latest.index.values), latest)) == {'Spain': 1, 'Guadeloupe': 2, 'Réunion': 3}
+    assert list(store.select(['Réunion'])['Cases']) == [3, 3]
+    country = case_aggregates.country
+    assert dict(zip(countries.names(country.index.values), country)) == {'Spain': 2, 'Guadeloupe': 2, 'Réunion': 2}
+    assert latest.index.max() == country.index.max() == key_of_unlisted('Guadeloupe')
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def key_of(name: str) -> int:
+    return int(countries.keys([name])[0])
+
+def key_of_unlisted(name: str) -> int:
+    return int(countries.extra_keys([name])[0])
+
+def timeseries(names: list[str]) -> pd.DataFrame:
+    # Two days of cases for each country, the country's position (from 1) each day
+    df = pd.DataFrame({
+        'Date': np.repeat(pd.date_range('2022-05-01', periods = 2), len(names)),
+        'Country': names * 2,
+        'Cases': list(range(1, len(names) + 1)) * 2,
+    })
+    df['Cumulative Cases'] = df.groupby('Country')['Cases'].cumsum()
+    names, keys = countries.encode(df['Country'])
+    return df.assign(**{'Country': names, 'Country Key': keys})
@@ -0,0 +1,133 @@
+# Tests the incremental refresh of the timeseries snapshots against the stand-in server.
+#
+# Run from the repository root with:  python -m pytest tests
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tools')]
+import standin_server
+
+import countries
+import data_loader
+import fetch
+import pages
+import snapshots
+import updates
+
+HEADERS = {
+    'cumulative_cases': 'Date,Country,Country_ISO3,Cases,Cumulative_cases\n',
+    'total_cases': 'Date,Cases,Cumulative_cases\n',
+}
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    '''Serves a small copy of each timeseries and points the loader and snapshots at it'''
+
+    # The country index is read relative to the repository root
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(fetch, 'RAW_DIR', str(tmp_path / 'raw'))
+    data_loader.refresh()
+
+    root = tmp_path / 'upstream'
+    root.mkdir()
+    server = standin_server.start(str(root))
+    url = f'http://127.0.0.1:{server.server_port}'
+    monkeypatch.setattr(data_loader, 'SOURCES', {name: f'{url}/{name}.csv' for name in data_loader.TIMESERIES})
+
+    files = {name: root / f'{name}.csv' for name in data_loader.TIMESERIES}
+    write(files['cumulative_cases'], HEADERS['cumulative_cases'], [
+        f'2022-05-0{day},{country},{iso3},1,{day}' for day in range(1, 6) for country, iso3 in
+        [('Spain', 'ESP'), ('Germany', 'DEU')]])
+    write(files['total_cases'], HEADERS['total_cases'], [f'2022-05-0{day},2,{2 * day}' for day in range(1, 6)])
+
+    yield files
+    server.shutdown()
+
+
+def test_fetch_changes(upstream):
+    url = data_loader.SOURCES['total_cases']
+    path = upstream['total_cases']
+
+    kind, data, meta = updates.fetch_changes(url)
+    assert kind == 'full' and data == path.read_bytes()
+
+    # Same ETag: a 304, nothing downloaded
+    kind, data, meta = updates.fetch_changes(url, meta)
+    assert (kind, data) == ('unchanged', b'')
+
+    # Appended rows: only the header and the new rows come back
+    append(path, ['2022-05-06,2,12', '2022-05-07,2,14'])
+    kind, data, meta = updates.fetch_changes(url, meta)
+    assert kind == 'append'
+    assert data == (HEADERS['total_cases'] + '2022-05-06,2,12\n2022-05-07,2,14\n').encode()
+
+    # A rewritten tail no longer matches the stored overlap: the whole file is fetched
+    path.write_bytes(path.read_bytes().replace(b'2022-05-07,2,14', b'2022-05-07,3,15') + b'2022-05-08,2,17\n')
+    kind, data, meta = updates.fetch_changes(url, meta)
+    assert kind == 'full' and data == path.read_bytes()
+
+
+def test_update_timeseries_unchanged(upstream):
+    assert data_loader.update_timeseries() == {name: 'full' for name in data_loader.TIMESERIES}
+    before = {name: snapshots.read(name) for name in data_loader.TIMESERIES}
+
+    assert data_loader.update_timeseries() == {name: 'unchanged' for name in data_loader.TIMESERIES}
+    for name in data_loader.TIMESERIES:
+        pd.testing.assert_frame_equal(snapshots.read(name), before[name])
+    assert snapshots.read_last_date() == '2022-05-05'
+
+
+def test_update_timeseries_appends_late_rows(upstream):
+    data_loader.update_timeseries()
+
+    # A new day, a country reporting late for an earlier day and a row already in the snapshot
+    append(upstream['cumulative_cases'], ['2022-05-06,Spain,ESP,1,6', '2022-05-03,France,FRA,4,4',
+        '2022-05-05,Germany,DEU,1,5'])
+    assert data_loader.update_timeseries()['cumulative_cases'] == 'append'
+
+    df = snapshots.read('cumulative_cases')
+    assert snapshots.read_last_date() == '2022-05-06'
+    assert len(df) == 12
+    assert df['Date'].is_monotonic_increasing
+    late = df[df['Country'] == 'France']
+    assert list(late['Date']) == [pd.Timestamp('2022-05-03')] and list(late['Cumulative Cases']) == [4]
+
+    # Keys are per process, so the snapshot keeps names only and is keyed as it loads
+    assert 'Country Key' not in df.columns
+    assert (data_loader.load_cumulative_cases()['Country Key'] != countries.UNKNOWN).all()
+
+
+def test_update_timeseries_refetches_rewritten_file(upstream):
+    data_loader.update_timeseries()
+
+    path = upstream['total_cases']
+    path.write_bytes(path.read_bytes().replace(b'2022-05-05,2,10', b'2022-05-05,3,11') + b'2022-05-06,2,13\n')
+    assert data_loader.update_timeseries()['total_cases'] == 'full'
+
+    df = snapshots.read('total_cases')
+    assert list(df['Cumulative Cases']) == [2, 4, 6, 8, 11, 13]
+
+
+def test_last_updated_is_recorded_without_snapshots(upstream):
+    assert snapshots.read_last_date() is None
+
+    # Nothing recorded yet: the summary is loaded once, and records the date for later pages
+    assert pages.last_updated() == 'May 05, 2022'
+    assert snapshots.read_last_date() == '2022-05-05'
+    assert not snapshots.exists('cumulative_cases')
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def write(path, header: str, rows: list[str]):
+    path.write_text(header + ''.join(row + '\n' for row in rows))
+
+def append(path, rows: list[str]):
+    with open(path, 'a') as f:
+        f.write(''.join(row + '\n' for row in rows))
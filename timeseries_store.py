@@ -0,0 +1,82 @@
+# This module partitions the per-country timeseries once so country selections are cheap.
+
+import numpy as np
+import pandas as pd
+
+import countries
+
+
+class CountryTimeseries:
+    '''Per-country case history stored as contiguous array slices.
+
+    Built once per data load, partitioned on the Country Key column (see
+    countries.py). Selecting any subset of countries concatenates their
+    precomputed slices instead of scanning the whole timeseries.
+    '''
+
+    def __init__(self, df: pd.DataFrame):
+        # Sorted by key, then date
+        keys, dates = df['Country Key'].values, df['Date'].values
+        order = np.lexsort((dates, keys))
+        keys, dates = keys[order], dates[order]
+        cases, cumulative = df['Cases'].values[order], df['Cumulative Cases'].values[order]
+
+        # Aliases can report one country under two names, and blank names share the
+        # UNKNOWN key; such rows are summed per date
+        repeated = (keys[1:] == keys[:-1]) & (dates[1:] == dates[:-1])
+        if repeated.any():
+            starts = np.flatnonzero(np.append(True, ~repeated))
+            keys, dates = keys[starts], dates[starts]
+            cases, cumulative = np.add.reduceat(cases, starts), np.add.reduceat(cumulative, starts)
+        self._dates, self._cases, self._cumulative = dates, cases, cumulative
+
+        self._keys, starts = np.unique(keys, return_index = True)
+        self._stops = np.append(starts[1:], len(keys))
+        self._slices = {key: (start, stop) for key, start, stop in zip(self._keys, starts, self._stops)}
+
+        # Countries in order of first appearance, as listed in the sidebar
+        order = pd.unique(df['Country Key'])
+        self._countries = list(countries.names(order))
+        self._name_keys = dict(zip(self._countries, order))
+
+    def __getstate__(self):
+        # Keys past the country table are numbered per process (see countries.py), so
+        # they travel with their names and are keyed again by the receiving process
+        state = dict(self.__dict__)
+        state['_extra_names'] = countries.extra_names(self._keys)
+        return state
+
+    def __setstate__(self, state):
+        extra = state.pop('_extra_names')
+        self.__dict__.update(state)
+        if extra:
+            self._keys = countries.rekey(self._keys, extra)
+            self._slices = dict(zip(self._keys, self._slices.values()))
+            self._name_keys = dict(zip(self._name_keys, countries.rekey(list(self._name_keys.values()), extra)))
+
+    def countries(self) -> list[str]:
+        '''Returns every country in the timeseries, in order of first appearance'''
+        return list(self._countries)
+
+    def select(self, selection: list[str]) -> pd.DataFrame:
+        '''Returns the Date, Country, Cases and Cumulative Cases rows of the selected countries'''
+
+        names = [name for name in selection if name in self._name_keys]
+        slices = [self._slices[self._name_keys[name]] for name in names]
+        if slices:
+            index = np.concatenate([np.arange(start, stop) for start, stop in slices])
+        else:
+            index = np.array([], dtype = int)
+
+        lengths = [stop - start for start, stop in slices]
+        return pd.DataFrame({
+            'Date': self._dates[index],
+            'Country': pd.Categorical(np.repeat(names, lengths), categories = names),
+            'Cases': self._cases[index],
+            'Cumulative Cases': self._cumulative[index],
+        })
+
+    def latest(self) -> pd.Series:
+        '''Returns each country's most recent daily increase, indexed by Country Key'''
+
+        return pd.Series(self._cases[self._stops - 1], index = self._keys)
@@ -0,0 +1,78 @@
+# Benchmarks charts.get_daily_increases against the per-country scan it replaced, and
+# the timeseries store's country selection against a boolean filter of the full frame.
+#
+# Builds a synthetic timeseries of 500 countries (every indexed country, then numbered
+# stand-ins keyed after the index) over several years and times the full table build
+# (index + lookup) and a ten-country selection as the history grows:
+#
+#   python tools/bench_daily_increases.py
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, TOOLS_DIR)
+os.chdir(ROOT)
+import charts
+import countries
+import synthetic
+from timeseries_store import CountryTimeseries
+
+COUNTRIES = 500
+YEARS = (1, 2, 4)
+REPEATS = 3
+NAMES = synthetic.country_names(COUNTRIES, countries.table()['Country'])
+SELECTION = NAMES[::50]
+
+
+def synthetic_timeseries(country_count: int, days: int) -> pd.DataFrame:
+    '''Returns a date-major timeseries shaped like timeseries-country-confirmed'''
+
+    rng = np.random.default_rng(0)
+    names = NAMES[:country_count]
+    dates = pd.date_range('2022-05-01', periods = days)
+    cases = rng.integers(0, 50, size = (days, country_count))
+    _, keys = countries.encode(pd.Series(names))
+
+    return pd.DataFrame({
+        'Date': np.repeat(dates, country_count),
+        'Country': pd.Categorical(np.tile(names, days)),
+        'Country Key': np.tile(keys, days),
+        'Cases': cases.ravel(),
+        'Cumulative Cases': cases.cumsum(axis = 0).ravel(),
+    })
+
+
+def legacy_daily_increases(df: pd.DataFrame):
+    '''The original implementation: one boolean scan of the timeseries per country'''
+
+    daily_increase = dict()
+    for country in df['Country'].unique():
+        country_data = df[df['Country'] == country]
+        daily_increase[country] = country_data.tail()['Cases'].loc[country_data.index[-1]]
+    return daily_increase
+
+
+if __name__ == '__main__':
+    print(f"{'years':>5} {'rows':>10} {'legacy (s)':>12} {'indexed (s)':>12} {'speedup':>8}"
+        f" {'filter (ms)':>12} {'select (ms)':>12} {'speedup':>8}")
+    for years in YEARS:
+        df = synthetic_timeseries(COUNTRIES, 365 * years)
+        cases = pd.Series(np.arange(COUNTRIES), index = pd.unique(df['Country Key']))
+
+        legacy = min(timeit.repeat(lambda: legacy_daily_increases(df), number = 1, repeat = REPEATS))
+        indexed = min(timeit.repeat(
+            lambda: charts.get_daily_increases(CountryTimeseries(df).latest(), cases),
+            number = 1, repeat = REPEATS))
+
+        store = CountryTimeseries(df)
+        filtered = min(timeit.repeat(lambda: df[df['Country'].isin(SELECTION)], number = 1, repeat = REPEATS))
+        selected = min(timeit.repeat(lambda: store.select(SELECTION), number = 1, repeat = REPEATS))
+        print(f'{years:>5} {len(df):>10,} {legacy:>12.3f} {indexed:>12.4f} {legacy / indexed:>7.0f}x'
+            f' {filtered * 1000:>12.2f} {selected * 1000:>12.2f} {filtered / selected:>7.0f}x')
@@ -0,0 +1,64 @@
+# Benchmarks maps.label_states against the per-state apply passes it replaced.
+#
+# Both versions label the same merged US frame on a fresh axis; the full plot_us
+# render is timed as well:
+#
+#   python tools/bench_state_labels.py
+
+import os
+import sys
+import timeit
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import geometry
+import maps
+
+REPEATS = 5
+
+# (state, dx, dy, separator) of the original hand-placed labels
+LEGACY_MANUAL = [
+    ('Louisiana', 0, -0.5, '\n'), ('Mississippi', 0, -0.75, '\n'), ('West Virginia', 0, -0.75, '\n'),
+    ('Virginia', 0, -0.75, '\n'), ('New York', 0.3, -0.5, '\n'), ('Vermont', 0.3, -0.5, '\n'),
+    ('Connecticut', 0.5, -0.4, '\n'), ('District of Columbia', 10, -2, ': '), ('Delaware', 8.2, -3, ': '),
+    ('New Hampshire', 4.5, -4.25, ': '), ('Massachusetts', 4.5, -3.7, ': '), ('Rhode Island', 4.4, -3.95, ': '),
+]
+
+
+def legacy_label_states(ax, us_merged):
+    '''The original labeling: one apply pass per placement, recomputing centroids per row'''
+
+    manual_list = [name for name, _, _, _ in LEGACY_MANUAL]
+    us_merged.apply(lambda x: ax.annotate(text = x.NAME + '\n' + str(int(x.cases)), xy = x['geometry'].centroid.coords[0],
+        ha = 'center', fontsize = 14) if x.NAME not in manual_list else '', axis = 1)
+    for name, dx, dy, separator in LEGACY_MANUAL:
+        us_merged.apply(lambda x: ax.annotate(text = x.NAME + separator + str(int(x.cases)),
+            xy = (x['geometry'].centroid.coords[0][0] + dx, x['geometry'].centroid.coords[0][1] + dy),
+            ha = 'center', fontsize = 14) if x.NAME == name else '', axis = 1)
+
+
+def time_labels(label, us_merged):
+    def run():
+        fig, ax = plt.subplots()
+        label(ax, us_merged)
+        plt.close(fig)
+    return min(timeit.repeat(run, number = 1, repeat = REPEATS))
+
+
+if __name__ == '__main__':
+    us_map_df = geometry.load('us')
+    state_cases = pd.DataFrame({'state': us_map_df['NAME'], 'cases': range(len(us_map_df))})
+    us_merged = us_map_df.merge(state_cases, left_on = 'NAME', right_on = 'state')
+
+    legacy = time_labels(legacy_label_states, us_merged)
+    batched = time_labels(maps.label_states, us_merged)
+    print(f'label placement: legacy {legacy * 1000:.1f} ms, batched {batched * 1000:.1f} ms '
+        f'({legacy / batched:.1f}x)')
+
+    full = min(timeit.repeat(lambda: plt.close(maps.plot_us(state_cases)[1]), number = 1, repeat = REPEATS))
+    print(f'plot_us with batched labels: {full * 1000:.1f} ms')
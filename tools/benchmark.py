@@ -0,0 +1,244 @@
+# Benchmarks every data_loader, charts and maps entry point against synthetic data.
+#
+# Synthetic upstream files are generated at the requested scale and served by the
+# stand-in server, so the whole download, parse, aggregate and render path runs
+# offline. Each benchmark is timed (best of --repeats, caches cleared first) and then
+# run once more under tracemalloc for its peak memory and retained allocations:
+#
+#   python tools/benchmark.py --rows 1000000 --countries 300 --days 730
+#   python tools/benchmark.py --save-baseline     # record results for this scale
+#
+# Results are compared with the stored baseline for the same scale, if there is one;
+# benchmarks slower than --threshold times their baseline (and by more than timer
+# noise) are reported as regressions and make the script exit with status 1.
+
+import argparse
+import gc
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, TOOLS_DIR)
+import standin_server
+import synthetic
+
+BASELINES = os.path.join(TOOLS_DIR, 'benchmark_baselines.json')
+
+# Slowdowns smaller than this are timer noise, whatever their ratio
+MIN_REGRESSION_SECONDS = 0.02
+
+# Public data_loader functions deliberately left out: cache bookkeeping, thin wrappers
+# of benchmarked functions and the schema report
+UNBENCHMARKED = ['refresh', 'sync', 'cache_stats', 'generation', 'refresh_data', 'source_path',
+    'schema_report', 'empty_frame', 'with_country_keys', 'write_snapshot']
+
+
+def benchmarks(data_loader, charts, maps) -> dict:
+    '''Returns {name: (setup, run)}; setup() prepares state, run() is what gets measured'''
+
+    def cold():
+        # Snapshots written by an earlier benchmark would let the loaders skip the csv sources
+        shutil.rmtree(data_loader.snapshots.SNAPSHOT_DIR, ignore_errors = True)
+        data_loader.refresh()
+
+    def prefetched():
+        cold()
+        data_loader.prefetch()
+
+    def updated():
+        cold()
+        data_loader.update_timeseries()
+
+    chunks = []
+    def chunked():
+        prefetched()
+        chunks[:] = data_loader.read_chunks('linelist')
+
+    def loaded():
+        data_loader.load_cumulative_cases()
+        data_loader.load_total_cases()
+        data_loader.load_state_cases()
+        data_loader.load_country_timeseries()
+        data_loader.load_summary()
+        data_loader.load_rollups()
+        data_loader.load_aggregates()
+
+    def figure(build):
+        # Renders the figure like the dashboard does, then frees it
+        def run():
+            fig = build()
+            fig = fig[0] if isinstance(fig, tuple) else fig
+            fig.canvas.draw()
+            plt.close(fig)
+        return run
+
+    def country_counts():
+        return data_loader.load_aggregates().country
+
+    def case_lists():
+        return charts.country_case_lists(data_loader.load_aggregates().country)
+
+    def selection():
+        return data_loader.load_country_timeseries().select(charts.DEFAULT_COUNTRIES)
+
+    return {
+        'data_loader.prefetch': (cold, data_loader.prefetch),
+        'data_loader.load_full_data': (prefetched, data_loader.load_full_data),
+        'data_loader.load_cumulative_cases': (prefetched, data_loader.load_cumulative_cases),
+        'data_loader.load_total_cases': (prefetched, data_loader.load_total_cases),
+        'data_loader.load_state_cases': (prefetched, data_loader.load_state_cases),
+        'data_loader.load_country_timeseries': (prefetched, data_loader.load_country_timeseries),
+        'data_loader.load_summary': (prefetched, data_loader.load_summary),
+        'data_loader.load_rollups': (prefetched, data_loader.load_rollups),
+        'data_loader.load_aggregates': (prefetched, data_loader.load_aggregates),
+        'data_loader.data_version': (prefetched, data_loader.data_version),
+        'data_loader.read_chunks': (prefetched, lambda: sum(len(chunk) for chunk in data_loader.read_chunks('linelist'))),
+        'data_loader.concat_chunks': (chunked, lambda: data_loader.concat_chunks(chunks, 'linelist')),
+        'data_loader.read_dataset': (prefetched, lambda: data_loader.read_dataset('linelist')),
+        'data_loader.stream_aggregates': (prefetched, lambda: data_loader.stream_aggregates('linelist')),
+        'data_loader.update_timeseries': (cold, data_loader.update_timeseries),
+        'data_loader.update_timeseries.noop': (updated, data_loader.update_timeseries),
+        'data_loader.build_snapshots': (cold, data_loader.build_snapshots),
+        'data_loader.rebuild': (prefetched, data_loader.rebuild),
+        'charts.cumulative_case_chart': (loaded, lambda: charts.cumulative_case_chart(selection()).to_dict()),
+        'charts.get_daily_increases': (loaded,
+            lambda: charts.get_daily_increases(data_loader.load_country_timeseries().latest(), country_counts())),
+        'charts.global_case_graph': (loaded, figure(lambda: charts.global_case_graph(data_loader.load_rollups()))),
+        'charts.global_pie_chart': (loaded, figure(lambda: charts.global_pie_chart(*case_lists()))),
+        'charts.gender_chart': (loaded, figure(lambda: charts.gender_chart(data_loader.load_aggregates().gender))),
+        'charts.hospitalization_chart': (loaded,
+            figure(lambda: charts.hospitalization_chart(data_loader.load_aggregates().hospitalised))),
+        'maps.world_map_figure': (loaded, figure(lambda: maps.world_map_figure(country_counts()))),
+        'maps.us_map_figure': (loaded, figure(lambda: maps.us_map_figure(data_loader.load_state_cases()))),
+        # Serialized too, as Streamlit sends the spec to the browser on every rerun
+        'maps.interactive_world_spec': (loaded, lambda: json.dumps(maps.interactive_world_spec(country_counts()))),
+        'maps.interactive_us_spec': (loaded,
+            lambda: json.dumps(maps.interactive_us_spec(data_loader.load_state_cases()))),
+    }
+
+
+def measure(setup, run, repeats: int) -> dict:
+    '''Returns the best wall time, peak traced memory and retained allocations of run()'''
+
+    timings = []
+    for _ in range(repeats):
+        setup()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    setup()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {'seconds': min(timings), 'peak_mb': peak / 1e6, 'retained_blocks': retained}
+
+
+def unbenchmarked(data_loader, names) -> list[str]:
+    '''Returns the public data_loader functions neither benchmarked nor listed in UNBENCHMARKED'''
+
+    covered = {name.split('.')[1] for name in names if name.startswith('data_loader.')} | set(UNBENCHMARKED)
+    return [name for name, func in inspect.getmembers(data_loader, inspect.isfunction)
+        if func.__module__ == 'data_loader' and not name.startswith('_') and name not in covered]
+
+
+def scale_key(args) -> str:
+    return f'rows={args.rows},countries={args.countries},days={args.days}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the dashboard against synthetic data.')
+    parser.add_argument('--rows', type = int, default = 10_000, help = 'linelist rows (10k to 10M)')
+    parser.add_argument('--countries', type = int, default = 200, help = 'countries in the timeseries')
+    parser.add_argument('--days', type = int, default = 365, help = 'days of timeseries history')
+    parser.add_argument('--repeats', type = int, default = 3, help = 'timed runs per benchmark')
+    parser.add_argument('--filter', default = '', help = 'only run benchmarks whose name contains this')
+    parser.add_argument('--threshold', type = float, default = 1.25,
+        help = 'slowdown over the baseline reported as a regression')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store these results as the baseline')
+    args = parser.parse_args()
+
+    # Shapefiles and prepared geometry are found relative to the repository root
+    os.chdir(ROOT)
+
+    work_dir = tempfile.mkdtemp(prefix = 'mpx-benchmark-')
+    os.makedirs(os.path.join(work_dir, 'upstream'))
+    server = standin_server.start(os.path.join(work_dir, 'upstream'))
+
+    # Point every cache at the scratch directory before the dashboard modules read them
+    os.environ['MPX_UPSTREAM'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['MPX_RAW_DIR'] = os.path.join(work_dir, 'raw')
+    os.environ['MPX_SNAPSHOT_DIR'] = os.path.join(work_dir, 'snapshots')
+    import charts
+    import data_loader
+    import geometry
+    import maps
+
+    paths = {name: url[len(data_loader.UPSTREAM):] for name, url in data_loader.SOURCES.items()}
+    names = synthetic.country_names(args.countries, geometry.load('world')['NAME'])
+    synthetic.write_fixtures(os.path.join(work_dir, 'upstream'), paths, args.rows, names, args.days,
+        list(geometry.load('us')['NAME']))
+
+    baselines = dict()
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    baseline = baselines.get(scale_key(args), dict())
+
+    runs = benchmarks(data_loader, charts, maps)
+    missing = unbenchmarked(data_loader, runs)
+    if missing:
+        print(f"Not benchmarked (add them or list them in UNBENCHMARKED): {', '.join(missing)}")
+
+    print(scale_key(args))
+    print(f"{'benchmark':<38} {'time (s)':>9} {'peak (MB)':>10} {'retained':>9} {'vs baseline':>12}")
+    results = dict()
+    regressions = []
+    for name, (setup, run) in runs.items():
+        if args.filter not in name:
+            continue
+        result = measure(setup, run, args.repeats)
+        results[name] = result
+
+        comparison = ''
+        if name in baseline:
+            ratio = result['seconds'] / baseline[name]['seconds']
+            comparison = f'{ratio:.2f}x'
+            if ratio > args.threshold and result['seconds'] - baseline[name]['seconds'] > MIN_REGRESSION_SECONDS:
+                comparison += ' SLOWER'
+                regressions.append(name)
+        print(f"{name:<38} {result['seconds']:>9.4f} {result['peak_mb']:>10.1f} "
+            f"{result['retained_blocks']:>9,} {comparison:>12}")
+
+    server.shutdown()
+    shutil.rmtree(work_dir)
+
+    if args.save_baseline:
+        baselines[scale_key(args)] = dict(baseline, **results)
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent = 1, sort_keys = True)
+        print(f'Saved baseline for {scale_key(args)}')
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,486 @@
+# Load-tests the dashboard with simulated concurrent viewers, fully offline.
+#
+# Starts the stand-in server with local copies of the upstream files (synthetic ones
+# at the requested scale, or --fixtures), launches `streamlit run main.py` against
+# it, and connects --sessions websocket clients that speak Streamlit's own protocol.
+# Each session plays SCRIPT --visits times: page switches through the navigation
+# menu, sidebar country changes, date range and map mode choices and case table
+# selections, pausing --think seconds (on average) between steps like a reader.
+#
+#   python tools/loadtest.py --sessions 20 --visits 3
+#   MPX_RENDER_WORKERS=4 python tools/loadtest.py --sessions 50 --think 0.5
+#
+# Reports per-rerun latency percentiles for every step, rerun throughput, errors
+# raised in the app, and the resident memory of the Streamlit process (with its
+# render workers) before, during and after the run. Memory is read from /proc, so it
+# is only reported on Linux.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+import numpy as np
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, TOOLS_DIR)
+import standin_server
+import synthetic
+
+# Steps of one visit: (step, argument). Steps whose widget is not on the page are skipped.
+#   page:       switch page in the navigation menu
+#   countries:  replace the sidebar country selection with this many random countries
+#   radio:      pick a random option of the radio with this label
+#   rows:       tick this many random rows of the case table
+SCRIPT = [
+    ('page', 'Home'),
+    ('countries', 3),
+    ('radio', 'Date Range'),
+    ('rows', 2),
+    ('page', 'Maps'),
+    ('radio', 'Map Rendering'),
+    ('page', 'Resources'),
+    ('page', 'Sources'),
+    ('page', 'Home'),
+    ('countries', 1),
+]
+
+# Seconds to wait for the server to come up, and for any one rerun
+STARTUP_TIMEOUT = 120
+RERUN_TIMEOUT = 300
+
+# Seconds between memory samples
+MEMORY_INTERVAL = 0.5
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+class Session:
+    '''One simulated viewer: a websocket connection and the widget values it has set'''
+
+    def __init__(self, socket, rng: random.Random):
+        self.socket = socket
+        self.rng = rng
+        self.states = dict()   # widget id -> WidgetState the browser would send
+        self.widgets = dict()  # (kind, label) -> element proto of the last run
+        self._cached = dict()  # forward message hash -> message, for cache references
+
+    async def rerun(self) -> tuple:
+        '''Reruns the script with the current widget states; returns (seconds, error messages)'''
+
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+
+        start = time.perf_counter()
+        await self.socket.send(message.SerializeToString())
+
+        widgets, errors = dict(), []
+        while True:
+            forward = await asyncio.wait_for(self._receive(), RERUN_TIMEOUT)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof('type')
+                if element_kind == 'exception':
+                    errors.append(f'{element.exception.type}: {element.exception.message}')
+                elif element_kind in WIDGET_LABELS:
+                    widget = getattr(element, element_kind)
+                    widgets.setdefault((element_kind, WIDGET_LABELS[element_kind](widget)), widget)
+            elif kind == 'script_finished' and forward.script_finished != FINISHED_EARLY_FOR_RERUN:
+                break
+        seconds = time.perf_counter() - start
+
+        # Like the browser, only widgets on the page send their values
+        ids = {widget.id for widget in widgets.values()}
+        self.states = {key: state for key, state in self.states.items() if key in ids}
+        self.widgets = widgets
+        return seconds, errors
+
+    def step(self, step: str, argument) -> bool:
+        '''Sets the widget a script step changes; returns False if it is not on the page'''
+
+        if step == 'page':
+            menu = self._component('option_menu')
+            if menu is None:
+                return False
+            self._set(menu.id, json_value = json.dumps(argument))
+
+        elif step == 'countries':
+            widget = self.widgets.get(('multiselect', 'Country Selection'))
+            if widget is None or not widget.options:
+                return False
+            chosen = self.rng.sample(range(len(widget.options)), min(argument, len(widget.options)))
+            if _uses_raw_values('multiselect'):
+                self._set(widget.id, string_array_value = [widget.options[i] for i in chosen])
+            else:
+                self._set(widget.id, int_array_value = chosen)
+
+        elif step == 'radio':
+            widget = self.widgets.get(('radio', argument))
+            if widget is None or not widget.options:
+                return False
+            chosen = self.rng.randrange(len(widget.options))
+            if _uses_raw_values('radio'):
+                self._set(widget.id, string_value = widget.options[chosen])
+            else:
+                self._set(widget.id, int_value = chosen)
+
+        elif step == 'rows':
+            grid = self._component('agGrid')
+            rows = _grid_rows(json.loads(grid.json_args)) if grid is not None else []
+            if not rows:
+                return False
+            chosen = self.rng.sample(rows, min(argument, len(rows)))
+            self._set(grid.id, json_value = json.dumps({'rowData': rows, 'selectedRows': chosen, 'colState': []}))
+
+        return True
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        forward = ForwardMsg()
+        data = await self.socket.recv()
+        if data is None:
+            raise ConnectionError('server closed the session')
+        forward.ParseFromString(data)
+
+        # Messages the server believes we cached arrive as references to their hash
+        if forward.WhichOneof('type') == 'ref_hash':
+            return self._cached[forward.ref_hash]
+        if forward.hash:
+            self._cached[forward.hash] = forward
+        return forward
+
+    def _component(self, name: str):
+        for (kind, label), widget in self.widgets.items():
+            if kind == 'component_instance' and label.endswith(name):
+                return widget
+        return None
+
+    def _set(self, widget_id: str, **value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        state = WidgetState(id = widget_id)
+        for field, field_value in value.items():
+            if isinstance(field_value, list):
+                getattr(state, field).data.extend(field_value)
+            else:
+                setattr(state, field, field_value)
+        self.states[widget_id] = state
+
+
+# Label identifying each widget kind the script can drive
+WIDGET_LABELS = {
+    'multiselect': lambda widget: widget.label,
+    'radio': lambda widget: widget.label,
+    'component_instance': lambda widget: widget.component_name,
+}
+
+# script_finished status of a run cut short by a newer rerun request
+FINISHED_EARLY_FOR_RERUN = 2
+
+
+def run_session(url: str, visits: int, think: float, seed: int, results: list, stop: float):
+    '''Coroutine playing SCRIPT visits times, appending (step, seconds, error messages) to results'''
+
+    async def play():
+        rng = random.Random(seed)
+        socket = await _connect(url)
+        session = Session(socket, rng)
+        try:
+            seconds, errors = await session.rerun()
+            results.append(('first load', seconds, errors))
+            for _ in range(visits):
+                for step, argument in SCRIPT:
+                    if time.monotonic() > stop:
+                        return
+                    await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+                    if not session.step(step, argument):
+                        results.append((_step_name(step, argument), None, []))
+                        continue
+                    seconds, errors = await session.rerun()
+                    results.append((_step_name(step, argument), seconds, errors))
+        except (ConnectionError, asyncio.TimeoutError) as error:
+            results.append(('disconnected', None, [repr(error)]))
+            print(f'session {seed}: {error!r}', file = sys.stderr)
+        finally:
+            await socket.close()
+
+    return play()
+
+
+def process_memory(pid: int) -> float:
+    '''Returns the resident memory (MB) of a process and its descendants, or nan off Linux'''
+
+    total = 0
+    for process in _descendants(pid):
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024 if total else float('nan')
+
+
+def report(results: list, seconds: float, memory: dict):
+    '''Prints latency percentiles per step, throughput, errors and memory growth'''
+
+    steps, messages = dict(), Counter()
+    for step, latency, errors in results:
+        entry = steps.setdefault(step, {'latencies': [], 'skipped': 0, 'errors': 0})
+        entry['errors'] += len(errors)
+        messages.update(error.splitlines()[0][:120] for error in errors if error)
+        if latency is None:
+            entry['skipped'] += 1
+        else:
+            entry['latencies'].append(latency)
+
+    header = ''.join(f"{f'p{p} (s)':>9}" for p in PERCENTILES)
+    print(f"{'step':<24} {'reruns':>7}{header}{'max (s)':>9} {'skipped':>8} {'errors':>7}")
+    measured = []
+    for step, entry in steps.items():
+        latencies = entry['latencies']
+        if step != 'first load':
+            measured += latencies
+        print(f"{step:<24} {len(latencies):>7}{_percentiles(latencies)} {entry['skipped']:>8} {entry['errors']:>7}")
+    print(f"{'all steps':<24} {len(measured):>7}{_percentiles(measured)}")
+
+    print()
+    print(f'{len(measured)} reruns in {seconds:.1f} s: {len(measured) / seconds:.2f} reruns/s')
+    print(f"memory (MB): {memory['start']:.0f} at start, {memory['peak']:.0f} peak, {memory['end']:.0f} at end "
+        f"({memory['end'] - memory['start']:+.0f})")
+
+    if messages:
+        print()
+        print('errors raised in the app:')
+        for message, count in messages.most_common():
+            print(f'{count:>7}  {message}')
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+class _Socket:
+    # Websocket client over whichever library is installed: websockets, or the tornado
+    # that older Streamlit releases are built on
+    def __init__(self, connection, tornado):
+        self.connection = connection
+        self.tornado = tornado
+
+    async def send(self, data):
+        if self.tornado:
+            await self.connection.write_message(data, binary = True)
+        else:
+            await self.connection.send(data)
+
+    async def recv(self):
+        if self.tornado:
+            return await self.connection.read_message()
+        try:
+            return await self.connection.recv()
+        except Exception:
+            return None
+
+    async def close(self):
+        if self.tornado:
+            self.connection.close()
+        else:
+            await self.connection.close()
+
+async def _connect(url):
+    try:
+        import websockets
+    except ImportError:
+        from tornado.websocket import websocket_connect
+        connection = await websocket_connect(url, subprotocols = ['streamlit'], max_message_size = 1 << 30)
+        return _Socket(connection, tornado = True)
+    connection = await websockets.connect(url, subprotocols = ['streamlit'], max_size = None)
+    return _Socket(connection, tornado = False)
+
+def _uses_raw_values(kind):
+    # Newer Streamlit releases send option values where older ones send indices
+    from streamlit.proto.MultiSelect_pb2 import MultiSelect
+    from streamlit.proto.Radio_pb2 import Radio
+
+    fields = {'multiselect': MultiSelect, 'radio': Radio}[kind].DESCRIPTOR.fields_by_name
+    return 'raw_value' in fields or 'raw_values' in fields
+
+def _grid_rows(args):
+    # The grid's rows travel in its gridOptions; the row shape is what the grid returns
+    if isinstance(args, dict):
+        if isinstance(args.get('rowData'), list):
+            return args['rowData']
+        values = args.values()
+    elif isinstance(args, list):
+        values = args
+    else:
+        return []
+    for value in values:
+        if isinstance(value, str) and 'rowData' in value:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                continue
+        rows = _grid_rows(value)
+        if rows:
+            return rows
+    return []
+
+def _step_name(step, argument):
+    return f'{step} {argument}'
+
+def _percentiles(latencies):
+    if not latencies:
+        return ''.join(f"{'-':>9}" for _ in PERCENTILES + [0])
+    values = np.percentile(latencies, PERCENTILES).tolist() + [max(latencies)]
+    return ''.join(f'{value:>9.3f}' for value in values)
+
+def _descendants(pid):
+    processes, pending = [], [pid]
+    while pending:
+        process = pending.pop()
+        processes.append(process)
+        try:
+            for task in os.listdir(f'/proc/{process}/task'):
+                with open(f'/proc/{process}/task/{task}/children') as f:
+                    pending += [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+    return processes
+
+def _endpoint(base, paths):
+    # Streamlit moved its endpoints under /_stcore; older releases serve them at the root
+    for path in paths:
+        try:
+            with urllib.request.urlopen(f'{base}/{path}', timeout = 2) as response:
+                if response.status == 200:
+                    return path
+        except OSError:
+            continue
+    return None
+
+def _start_streamlit(app, port, env):
+    command = [sys.executable, '-m', 'streamlit', 'run', app, '--server.headless', 'true',
+        '--server.address', '127.0.0.1', '--server.port', str(port), '--server.fileWatcherType', 'none',
+        '--browser.gatherUsageStats', 'false']
+    process = subprocess.Popen(command, cwd = ROOT, env = env, stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL)
+
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'streamlit exited with status {process.returncode}')
+        health = _endpoint(base, ['_stcore/health', 'healthz'])
+        if health:
+            stream = 'stream' if health == 'healthz' else '_stcore/stream'
+            return process, f'ws://127.0.0.1:{port}/{stream}'
+        time.sleep(0.5)
+
+    process.terminate()
+    raise SystemExit(f'streamlit did not start within {STARTUP_TIMEOUT} s')
+
+def _sample_memory(pid, samples, done):
+    while not done.is_set():
+        samples.append(process_memory(pid))
+        done.wait(MEMORY_INTERVAL)
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Load-test the dashboard with simulated sessions.')
+    parser.add_argument('--sessions', type = int, default = 10, help = 'concurrent simulated viewers')
+    parser.add_argument('--visits', type = int, default = 2, help = 'times each session plays the script')
+    parser.add_argument('--think', type = float, default = 1.0, help = 'mean seconds between steps')
+    parser.add_argument('--ramp', type = float, default = 5.0, help = 'seconds over which sessions join')
+    parser.add_argument('--duration', type = float, default = 0, help = 'stop after this many seconds (0: no limit)')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--app', default = 'main.py', help = 'Streamlit script to run')
+    parser.add_argument('--fixtures', help = 'directory of upstream file copies (default: synthetic files)')
+    parser.add_argument('--rows', type = int, default = 10_000, help = 'synthetic linelist rows')
+    parser.add_argument('--countries', type = int, default = 100, help = 'synthetic timeseries countries')
+    parser.add_argument('--days', type = int, default = 365, help = 'synthetic days of history')
+    args = parser.parse_args()
+
+    # Shapefiles and prepared geometry are found relative to the repository root
+    os.chdir(ROOT)
+
+    work_dir = tempfile.mkdtemp(prefix = 'mpx-loadtest-')
+    upstream = args.fixtures or os.path.join(work_dir, 'upstream')
+    server = standin_server.start(upstream)
+
+    # The app and the fixture writer read the same settings
+    env = dict(os.environ, MPX_UPSTREAM = f'http://127.0.0.1:{server.server_port}',
+        MPX_RAW_DIR = os.path.join(work_dir, 'raw'), MPX_SNAPSHOT_DIR = os.path.join(work_dir, 'snapshots'),
+        MPX_REFRESH_INTERVAL = os.environ.get('MPX_REFRESH_INTERVAL', '0'))
+    os.environ.update(env)
+    if not args.fixtures:
+        import charts
+        import data_loader
+        import geometry
+
+        os.makedirs(upstream)
+        paths = {name: url[len(data_loader.UPSTREAM):] for name, url in data_loader.SOURCES.items()}
+
+        # The sidebar's default countries must exist, or the Home page cannot draw
+        known = dict.fromkeys(charts.DEFAULT_COUNTRIES + list(geometry.load('world')['NAME']))
+        names = synthetic.country_names(args.countries, known)
+        synthetic.write_fixtures(upstream, paths, args.rows, names, args.days, list(geometry.load('us')['NAME']))
+
+    process, url = _start_streamlit(args.app, _free_port(), env)
+    try:
+        # One session loads every page first, so the run measures warm reruns; the
+        # cold first load is reported on its own
+        warm_up = []
+        asyncio.run(run_session(url, 1, 0, -1, warm_up, float('inf')))
+        print(f'cold start: {warm_up[0][1]:.2f} s' if warm_up and warm_up[0][1] is not None else 'cold start failed')
+
+        samples, done = [], threading.Event()
+        start_memory = process_memory(process.pid)
+        sampler = threading.Thread(target = _sample_memory, args = (process.pid, samples, done), daemon = True)
+        sampler.start()
+
+        async def run_all():
+            stop = time.monotonic() + args.duration if args.duration else float('inf')
+            sessions = []
+            for i in range(args.sessions):
+                sessions.append(asyncio.create_task(
+                    run_session(url, args.visits, args.think, args.seed + i, results, stop)))
+                await asyncio.sleep(args.ramp / max(args.sessions, 1))
+            await asyncio.gather(*sessions)
+
+        results = []
+        started = time.perf_counter()
+        asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+
+        done.set()
+        sampler.join()
+        memory = {'start': start_memory, 'peak': np.nanmax(samples + [start_memory]), 'end': process_memory(process.pid)}
+
+        print(f'{args.sessions} sessions x {args.visits} visits, think {args.think} s')
+        report(results, elapsed, memory)
+    finally:
+        process.terminate()
+        process.wait()
+        server.shutdown()
+        shutil.rmtree(work_dir)
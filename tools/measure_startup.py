@@ -0,0 +1,63 @@
+# Measures what each dashboard page costs a fresh Streamlit process before it can paint.
+#
+# Every measurement runs in its own interpreter, so nothing is already imported or
+# cached. Streamlit itself is imported first and not counted, since the server has
+# always loaded it. Reports:
+#   - the import time of each module the pages use
+#   - per page, the time to import its declared modules and load its datasets
+#     (pages.load), i.e. the work done before the page's first element is drawn
+#
+# Data comes from wherever data_loader points (snapshots, MPX_UPSTREAM, ...):
+#
+#   python tools/measure_startup.py
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pages
+
+# data_loader and its heavy dependencies, then every module a page declares
+MODULES = ['pandas', 'pyarrow', 'requests', 'data_loader'] + pages.modules()
+REPEATS = 3
+
+IMPORT_TIMER = '''
+import time
+import streamlit
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+PAGE_TIMER = '''
+import time
+import streamlit
+start = time.perf_counter()
+import pages
+pages.load({page!r})
+print(time.perf_counter() - start)
+'''
+
+
+def timed(code: str) -> float:
+    '''Runs code in a fresh interpreter and returns the fastest of its printed timings'''
+
+    timings = []
+    for _ in range(REPEATS):
+        result = subprocess.run([sys.executable, '-c', code], cwd = ROOT, capture_output = True,
+            text = True, check = True)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+if __name__ == '__main__':
+    print(f"{'module':<14} {'import (s)':>10}")
+    for module in MODULES:
+        print(f'{module:<14} {timed(IMPORT_TIMER.format(module = module)):>10.3f}')
+
+    print()
+    print(f"{'page':<14} {'first paint (s)':>15}")
+    for page in pages.PAGES:
+        print(f'{page:<14} {timed(PAGE_TIMER.format(page = page)):>15.3f}')
@@ -0,0 +1,88 @@
+# Serves local copies of the upstream csv files, standing in for raw.githubusercontent.com.
+#
+# Supports ETag/Last-Modified validators and byte ranges like the real host, so the
+# incremental refresh path can be exercised offline:
+#
+#   python tools/standin_server.py --root fixtures --port 8765
+#   MPX_UPSTREAM=http://127.0.0.1:8765 streamlit run main.py
+#
+# Files are looked up by URL path under --root, e.g.
+#   fixtures/globaldothealth/monkeypox/<commit>/timeseries-confirmed-deprecated.csv
+
+import argparse
+import email.utils
+import hashlib
+import os
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInHandler(SimpleHTTPRequestHandler):
+    '''Static file handler with ETag, conditional and Range request support'''
+
+    def do_GET(self):
+        file_path = self.translate_path(self.path)
+        if not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        last_modified = email.utils.formatdate(os.path.getmtime(file_path), usegmt = True)
+
+        if self.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        status, body, content_range = 200, data, None
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.end_headers()
+                return
+            end = min(end, len(data) - 1)
+            status, body = 206, data[start:end + 1]
+            content_range = f'bytes {start}-{end}/{len(data)}'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(root: str, port: int = 0):
+    '''Starts the server on a background thread and returns it (server_port holds the port)'''
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), partial(StandInHandler, directory = root))
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serve local copies of the upstream csv files.')
+    parser.add_argument('--root', default = 'fixtures', help = 'directory mirroring the upstream URL paths')
+    parser.add_argument('--port', type = int, default = 8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), partial(StandInHandler, directory = args.root))
+    print(f'Serving {args.root} at http://127.0.0.1:{args.port} (set MPX_UPSTREAM to this address)')
+    server.serve_forever()
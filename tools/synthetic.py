@@ -0,0 +1,115 @@
+# Generates synthetic upstream csv files shaped like the Global.health and CDC sources.
+#
+# The files carry the same columns as upstream (including the ones the dashboard
+# never reads) so the schema pushdown, chunked reads and snapshots see realistic
+# input. Everything is seeded, so a given scale always produces the same bytes.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+START_DATE = '2022-05-01'
+
+# Rows generated per write, so 10M-row linelists never sit in memory at once
+CHUNK_ROWS = 1_000_000
+
+STATUSES = ['confirmed', 'suspected', 'discarded', 'omit_error']
+AGES = ['0-9', '10-19', '20-29', '30-39', '40-49', '50-59', '60-69', '70+', '']
+GENDERS = ['male', 'female', '']
+HOSPITALISED = ['Y', 'N', 'NA', '']
+SYMPTOMS = ['rash', 'fever', 'rash, fever', 'lesions', 'headache', '']
+
+
+def country_names(count: int, known: list[str] = ()) -> list[str]:
+    '''Returns count country names, real ones from known first, then numbered stand-ins'''
+
+    names = list(known)[:count]
+    return names + [f'Country {i}' for i in range(count - len(names))]
+
+
+def linelist(rows: int, names: list[str], days: int, seed: int = 0):
+    '''Yields the linelist as dataframes of at most CHUNK_ROWS rows'''
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START_DATE, periods = days).strftime('%Y-%m-%d').values
+    weights = _country_weights(len(names), rng)
+    iso3 = np.array([name[:3].upper() for name in names])
+
+    for start in range(0, rows, CHUNK_ROWS):
+        size = min(CHUNK_ROWS, rows - start)
+        country = rng.choice(len(names), size = size, p = weights)
+        confirmed = rng.integers(0, days, size = size)
+        onset = np.where(rng.random(size) < 0.3, dates[np.maximum(confirmed - 5, 0)], '')
+        yield pd.DataFrame({
+            'ID': np.arange(start, start + size),
+            'Status': rng.choice(STATUSES, size = size, p = [0.6, 0.3, 0.05, 0.05]),
+            'Location': '',
+            'Country': np.array(names)[country],
+            'Country_ISO3': iso3[country],
+            'Age': rng.choice(AGES, size = size),
+            'Gender': rng.choice(GENDERS, size = size, p = [0.85, 0.05, 0.1]),
+            'Date_onset': onset,
+            'Date_confirmation': dates[confirmed],
+            'Symptoms': rng.choice(SYMPTOMS, size = size),
+            'Hospitalised (Y/N/NA)': rng.choice(HOSPITALISED, size = size),
+            'Source': 'https://example.org/source',
+            'Source_II': '',
+            'Contact_comment': '',
+            'Date_last_modified': dates[-1],
+            'Date_entry': dates[confirmed],
+        })
+
+
+def country_timeseries(names: list[str], days: int, seed: int = 0) -> pd.DataFrame:
+    '''Returns the per-country daily timeseries in upstream (date-major) order'''
+
+    rng = np.random.default_rng(seed)
+    cases = rng.poisson(_country_weights(len(names), rng) * 500, size = (days, len(names)))
+    return pd.DataFrame({
+        'Cases': cases.ravel(),
+        'Cumulative_cases': cases.cumsum(axis = 0).ravel(),
+        'Date': np.repeat(pd.date_range(START_DATE, periods = days).strftime('%Y-%m-%d'), len(names)),
+        'Country': np.tile(names, days),
+    })
+
+
+def total_timeseries(by_country: pd.DataFrame) -> pd.DataFrame:
+    '''Returns the global daily timeseries summed from the per-country one'''
+
+    cases = by_country.groupby('Date', sort = True)['Cases'].sum()
+    return pd.DataFrame({'Date': cases.index, 'Cases': cases.values, 'Cumulative_cases': cases.cumsum().values})
+
+
+def state_cases(states: list[str], seed: int = 0) -> pd.DataFrame:
+    '''Returns case counts for every US state'''
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'state': states, 'cases': rng.integers(0, 5000, size = len(states)),
+        'range': '', 'pop': rng.integers(500_000, 40_000_000, size = len(states))})
+
+
+def write_fixtures(root: str, paths: dict, rows: int, names: list[str], days: int, states: list[str],
+    seed: int = 0):
+    '''Writes every synthetic source under root at its {name: relative path}'''
+
+    def target(name):
+        file_path = os.path.join(root, paths[name].lstrip('/'))
+        os.makedirs(os.path.dirname(file_path), exist_ok = True)
+        return file_path
+
+    with open(target('linelist'), 'w') as f:
+        for i, chunk in enumerate(linelist(rows, names, days, seed)):
+            chunk.to_csv(f, index = False, header = i == 0)
+
+    by_country = country_timeseries(names, days, seed)
+    by_country.to_csv(target('cumulative_cases'), index = False)
+    total_timeseries(by_country).to_csv(target('total_cases'), index = False)
+    state_cases(states, seed).to_csv(target('state_cases'), index = False)
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _country_weights(count, rng):
+    # A few countries carry most cases, like the real outbreak
+    weights = rng.pareto(1.2, size = count) + 0.01
+    return weights / weights.sum()
@@ -0,0 +1,74 @@
+# This module downloads only what changed in an upstream csv since it was last fetched.
+#
+# Each fetch is recorded in a small metadata dict (validators, byte length and the
+# last bytes of the file). The next fetch sends a conditional request for the bytes
+# past that length; an unchanged file costs a 304 and an appended file costs only
+# the new rows. Anything else falls back to downloading the whole file.
+
+import requests
+
+# Bytes re-requested before the stored end of file to check it was only appended to
+TAIL_BYTES = 512
+
+# Seconds to wait for the upstream server
+TIMEOUT = 30
+
+
+def fetch_changes(url: str, meta: dict = None, session = None):
+    '''Returns (kind, data, meta), where kind is 'unchanged', 'append' or 'full'.
+
+    For 'append', data holds the csv header followed by only the new rows. For
+    'full', data holds the whole file. The returned meta replaces the old one.
+    '''
+
+    session = session or requests
+    if not meta:
+        return _fetch_full(url, session)
+
+    tail = bytes.fromhex(meta['tail'])
+    headers = {'Range': f"bytes={meta['length'] - len(tail)}-", 'Accept-Encoding': 'identity'}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    elif meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    response = session.get(url, headers = headers, timeout = TIMEOUT)
+    if response.status_code == 304:
+        return 'unchanged', b'', meta
+
+    # The overlap must match what we stored, otherwise the file was rewritten
+    if response.status_code == 206 and response.content.startswith(tail):
+        delta = response.content[len(tail):]
+        new_meta = _meta(response, meta['length'] + len(delta), (tail + delta)[-TAIL_BYTES:],
+            bytes.fromhex(meta['header']))
+        if not delta:
+            return 'unchanged', b'', new_meta
+        return 'append', bytes.fromhex(meta['header']) + delta, new_meta
+
+    if response.status_code == 200:
+        return 'full', response.content, _meta(response, len(response.content),
+            response.content[-TAIL_BYTES:], _header(response.content))
+
+    # 416 (file shrank), a mismatched overlap or an unexpected status
+    return _fetch_full(url, session)
+
+
+# ----------------- HELPER FUNCTIONS ---------------- #
+def _fetch_full(url, session):
+    response = session.get(url, headers = {'Accept-Encoding': 'identity'}, timeout = TIMEOUT)
+    response.raise_for_status()
+    data = response.content
+
+    return 'full', data, _meta(response, len(data), data[-TAIL_BYTES:], _header(data))
+
+def _header(data: bytes):
+    return data[:data.find(b'\n') + 1]
+
+def _meta(response, length, tail, header):
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'length': length,
+        'tail': tail.hex(),
+        'header': header.hex(),
+    }